@@ -1,17 +1,127 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
+from pymongo.errors import PyMongoError
 
+from src.db import mongo_connector
+from src.db.executor import ingest_executor
+from src.db.indexes import ensure_indexes
+from src.file_inventory import file_inventory
+from src.service.data_ingestion import DataIngestionService
+from src.service.summary import SummaryService
 from src.utils import get_logger
 from src.root_router import router
+from src.template_catalog import warm_catalog
+
+
+def backfill_vendor_tags():
+    try:
+        DataIngestionService().backfill_vendor_tags()
+    except Exception:
+        log.exception("Could not tag the stored transactions with their vendor")
+
+
+def build_summary():
+    try:
+        # the dashboard counts the transactions themselves until it is built
+        SummaryService().ensure_built()
+    except Exception:
+        log.exception("Could not build the transaction summary")
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        ensure_indexes()
+    except PyMongoError as e:
+        # e.g. the server is unreachable, the dashboard starts without them
+        log.warning(f"Could not ensure the indexes: {e}")
+    warm_catalog()
+    file_inventory.start()
+    # queued before any ingestion job, the dashboard is served meanwhile
+    ingest_executor.submit(backfill_vendor_tags)
+    ingest_executor.submit(build_summary)
+    yield
+    file_inventory.stop()
+    mongo_connector.close_connection()
+
+
+app = FastAPI(lifespan=lifespan)
 log = get_logger(__name__)
 app.mount("/static", StaticFiles(directory="src/static"), name="static")
 app.include_router(router)
 
 if __name__ == "__main__":
+    import argparse
+    import os
+
     import uvicorn
 
+    from src.parse_cache import PARSE_CACHE_ENV
+
+    arg_parser = argparse.ArgumentParser(description="Run the financials dashboard")
+    arg_parser.add_argument(
+        "--no-parse-cache",
+        action="store_true",
+        help="parse every statement and vendor export again instead of using cached frames",
+    )
+    commands = arg_parser.add_subparsers(dest="command")
+    ingest_command = commands.add_parser(
+        "ingest",
+        help="ingest the bank and vendor files and exit",
+    )
+    ingest_command.add_argument(
+        "--parser-workers",
+        type=int,
+        default=1,
+        help="processes parsing the bank statements, 0 for one per CPU",
+    )
+    commands.add_parser(
+        "retag",
+        help="tag the stored transactions with their vendor again and exit, "
+        "restart a running server to drop its cached pages",
+    )
+    commands.add_parser(
+        "rebuild-summary",
+        help="recompute the transaction summary from all transactions and exit, "
+        "restart a running server to drop its cached pages",
+    )
+    commands.add_parser(
+        "explain",
+        help="explain every query the services send and flag collection scans",
+    )
+    args = arg_parser.parse_args()
+
+    if args.no_parse_cache:
+        # environment is inherited by the reloader and the parser processes
+        os.environ[PARSE_CACHE_ENV] = "0"
+
+    if args.command == "ingest":
+        ensure_indexes()
+        service = DataIngestionService(args.parser_workers or None)
+        log.info(f"Ingested {service.ingest_data()} records")
+        raise SystemExit(0)
+
+    if args.command == "retag":
+        ensure_indexes()
+        DataIngestionService().retag_transactions()
+        raise SystemExit(0)
+
+    if args.command == "rebuild-summary":
+        ensure_indexes()
+        SummaryService().rebuild()
+        raise SystemExit(0)
+
+    if args.command == "explain":
+        from src.db.indexes import explain_query_shapes
+
+        ensure_indexes()
+        collection_scans = explain_query_shapes()
+        for query_shape in collection_scans:
+            log.warning(f"COLLSCAN: {query_shape}")
+        raise SystemExit(1 if collection_scans else 0)
+
     uvicorn.run(
         "src.__main__:app",
         host="127.0.0.1",
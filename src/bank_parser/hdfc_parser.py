@@ -1,143 +1,83 @@
 import pandas as pd
+from src.bank_parser.parser import ExcelDataReader
 from src.utils import get_logger
 import re
 import hashlib
 
 log = get_logger(__name__)
 
+# Patterns for different types of transactions
+NARRATION_PATTERNS = {
+    "UPI": re.compile(r"UPI-(.*?)-(.*)-(.*?)-(.*)"),
+    "NEFT": re.compile(r"NEFT CR-(.*?)-"),
+    "POS": re.compile(r"POS (\d+X{6}\d+)\s(.*)$"),
+    "CRV POS": re.compile(r"CRV POS (\d+\*{6}\d+)\s(.*)$"),
+}
 
-# Function to generate unique identifier
-def generate_unique_id(row):
-    # Concatenate values from all columns into a single string
-    row_string = "".join(str(value) for value in row)
-    print(row_string)
-    log.debug(f"Genrating hash for: {row['Narration']}")
-    # Generate hash value using SHA-256 hash function
-    hash_value = hashlib.sha256(row_string.encode()).hexdigest()
-    return hash_value
 
+# Function to generate unique identifiers for a batch of rows
+def generate_unique_ids(df: pd.DataFrame) -> pd.Series:
+    # Concatenate values from all columns into a single string per row,
+    # going through object so every value is formatted with str()
+    cells = df.astype(object).astype(str)
+    row_strings = cells.iloc[:, 0]
+    for column in cells.columns[1:]:
+        row_strings = row_strings + cells[column]
 
-class HdfcExcelDataReader:
-    invalid_init = False
+    # Generate hash values using SHA-256 hash function
+    hash_values = [
+        hashlib.sha256(row_string.encode()).hexdigest() for row_string in row_strings
+    ]
+    return pd.Series(hash_values, index=df.index, dtype=object)
 
-    def __init__(self, file_paths: list[str]):
-        self.file_paths = [
-            file_path for file_path in file_paths if "old" not in file_path
-        ]
 
-        if len(self.file_paths) == 0:
-            self.invalid_init = True
+class HdfcExcelDataReader(ExcelDataReader):
+    date_format = "%d/%m/%y"
 
-    def read_data(self) -> pd.DataFrame:
+    def _extract_narration_info(self, narrations: pd.Series) -> pd.DataFrame:
         """
-        Read data from the specified sheet of the Excel file, starting from
-        the row after the header row,
-        and ending at the row before the row containing stars after the table.
-
-        Args:
-        - sheet_name (str or int, default 0): Name or index of the sheet to
-        read.
+        Classifies every narration of the column against the transaction
+        patterns, a later pattern overrides the type of an earlier one.
 
         Returns:
-        - DataFrame containing the data from the specified sheet, delimited by
-        rows containing stars.
+        - DataFrame with one column per extracted field, null where the
+        field does not apply to the row.
         """
-        if self.invalid_init:
-            raise ValueError("No valid file paths were provided.")
-        try:
-            transaction_tables = []
-            for file_path in self.file_paths:
-                all_data = self._read_all_data(file_path)
-                start_row = self._find_start_row(all_data)
-                end_row = self._find_end_row(all_data, (start_row or 0) + 1)
-
-                if start_row is not None and end_row is not None:
-                    log.debug(f"Start row: {start_row}")
-                    log.debug(f"End row: {end_row}")
-                    transaction_tables.append(
-                        self._extract_table_data(file_path, start_row, end_row)
-                    )
-                    log.debug(
-                        f"{len(transaction_tables[-1])} Transactions read from file: {file_path}"
-                    )
-                else:
-                    raise ValueError(
-                        "Could not find start and/or end row of the table."
-                    )
-
-            return self._combine_dataframes(transaction_tables)
-        except Exception as e:
-            raise Exception(f"An error occurred while reading the Excel file: {e}")
-
-    def _extract_narration_info(self, narration):
-        # Define patterns for different types of transactions
-        patterns = {
-            "UPI": r"UPI-(.*?)-(.*)-(.*?)-(.*)",
-            "NEFT": r"NEFT CR-(.*?)-",
-            "POS": r"POS (\d+X{6}\d+)\s(.*)$",
-            "CRV POS": r"CRV POS (\d+\*{6}\d+)\s(.*)$",
-        }
-
-        extracted_info = {}
-        for key, pattern in patterns.items():
-            match = re.search(pattern, narration)
-            if match:
-                if key == "UPI":
-                    extracted_info["type"] = key
-                    extracted_info["sender"] = match.group(3)
-                    extracted_info["message"] = match.group(4)
-                elif key == "POS" or key == "CRV POS":
-                    extracted_info["type"] = key
-                    extracted_info["ID"] = match.group(1)
-                    extracted_info["sender_name"] = match.group(2)
-                else:
-                    extracted_info["type"] = key
-                    extracted_info[key] = match.group(1)
-
-        return extracted_info
-
-    def _read_all_data(self, file_path, sheet_name=0):
-        return pd.read_excel(file_path, sheet_name=sheet_name, header=None)
+        info = pd.DataFrame(
+            index=narrations.index,
+            columns=["type", "sender", "message", "NEFT", "ID", "sender_name"],
+            dtype=object,
+        )
+        for key, pattern in NARRATION_PATTERNS.items():
+            match = narrations.str.extract(pattern)
+            matched = match[0].notna()
+            info.loc[matched, "type"] = key
+            if key == "UPI":
+                info.loc[matched, "sender"] = match.loc[matched, 2]
+                info.loc[matched, "message"] = match.loc[matched, 3]
+            elif key == "POS" or key == "CRV POS":
+                info.loc[matched, "ID"] = match.loc[matched, 0]
+                info.loc[matched, "sender_name"] = match.loc[matched, 1]
+            else:
+                info.loc[matched, key] = match.loc[matched, 0]
+
+        return info
 
     def _find_start_row(self, all_data):
-        for index, row in all_data.iterrows():
-            if row.astype(str).str.contains("Narration").any():
-                return index  # Start from the row after the header row
-        return None
+        # Start from the row after the header row
+        mask = self._cells_matching(
+            all_data, lambda cells: cells.contains("Narration", regex=False)
+        )
+        return self._first_row(mask)
 
     def _find_end_row(self, all_data, start_row):
-        for index, row in all_data.iterrows():
-            if index > start_row and row.str.startswith("*").any():
-                # End at the row before the stars row after the table
-                return index - 1
-        return None
+        # End at the row before the stars row after the table
+        mask = self._cells_matching(all_data, lambda cells: cells.startswith("*"))
+        end_row = self._first_row(mask, after=start_row)
+        return end_row - 1 if end_row is not None else None
 
-    def _convert_to_datetime(self, df, columns):
-        """
-        Convert specified columns to datetime format using the given date
-        format.
-        """
-        date_format = "%d/%m/%y"
-        for col in columns:
-            df[col] = pd.to_datetime(df[col], format=date_format, errors="coerce")
-        return df
-
-    def _convert_to_numeric(self, df, columns, fill_value=0):
-        """
-        Convert specified columns to numeric data type.
-        """
-        for col in columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-            df[col] = df[col].fillna(fill_value)
-        return df
-
-    def _extract_table_data(self, file_path, start_row, end_row, sheet_name=0):
-        df = pd.read_excel(
-            file_path,
-            sheet_name=sheet_name,
-            skiprows=start_row,
-            nrows=end_row - start_row,
-        )
+    def _extract_table_data(self, all_data, start_row, end_row):
+        df = self._slice_table(all_data, start_row, end_row)
 
         df = df.drop(df.index[0])
 
@@ -145,7 +85,7 @@ class HdfcExcelDataReader:
         df = df.dropna(how="all")
 
         # Convert to relevant data types
-        df = self._convert_to_datetime(df, ["Date", "Value Dt"])
+        df = self._convert_to_datetime(df, ["Date", "Value Dt"], self.date_format)
         df = self._convert_to_numeric(
             df, ["Withdrawal Amt.", "Deposit Amt.", "Closing Balance"]
         )
@@ -157,9 +97,10 @@ class HdfcExcelDataReader:
         combined_df.drop_duplicates(inplace=True)
 
         empty_id_rows = combined_df["Chq./Ref.No."] == "0" * 15
-        combined_df.loc[empty_id_rows, "Chq./Ref.No."] = combined_df[
-            empty_id_rows
-        ].apply(generate_unique_id, axis=1)
+        log.debug(f"Generating hashes for {empty_id_rows.sum()} transactions")
+        combined_df.loc[empty_id_rows, "Chq./Ref.No."] = generate_unique_ids(
+            combined_df[empty_id_rows]
+        )
 
         combined_df["_id"] = (
             combined_df["Chq./Ref.No."]
@@ -169,8 +110,8 @@ class HdfcExcelDataReader:
 
         combined_df.drop("Chq./Ref.No.", axis=1, inplace=True)
 
-        combined_df["ExtractedInfo"] = combined_df["Narration"].apply(
-            self._extract_narration_info
+        combined_df["ExtractedInfo"] = self._to_extracted_info(
+            self._extract_narration_info(combined_df["Narration"])
         )
 
         combined_df["Bank"] = "HDFC"
@@ -1,128 +1,97 @@
 import pandas as pd
+from src.bank_parser.parser import ExcelDataReader
 from src.utils import get_logger
 import re
 
 log = get_logger(__name__)
 
-
-class IciciExcelDataReader:
-    invalid_init = False
-
-    def __init__(self, file_paths: list[str]):
-        self.file_paths = [
-            file_path for file_path in file_paths if "old" not in file_path
-        ]
-
-        if len(self.file_paths) == 0:
-            self.invalid_init = True
-
-    def read_data(self, sheet_name=0) -> pd.DataFrame:
+# Patterns for different types of transactions (and they may expand)
+NARRATION_PATTERNS = {
+    "NEFT": re.compile(r"NEFT-(.*?)-(.*?)-(.*)"),
+    "Interest": re.compile(r"(\d+):Int\.Pd:(\d{2}-\d{2}-\d{4}) to (\d{2}-\d{2}-\d{4})"),
+}
+
+# Fields which can end up in the ExtractedInfo of a narration
+INFO_FIELDS = [
+    "type",
+    "transaction_id",
+    "beneficiary_details",
+    "message",
+    "beneficiary_bank",
+    "bank_txn_id",
+    "sender_bank",
+    "details",
+    "start_date",
+    "end_date",
+]
+
+
+class IciciExcelDataReader(ExcelDataReader):
+    date_format = "%d/%m/%Y"
+
+    def _extract_narration_info(self, narrations: pd.Series) -> pd.DataFrame:
         """
-        Read data from the specified sheet of the Excel file, starting from
-        the row after the header row,
-        and ending at the row before the row containing stars after the table.
-
-        Args:
-        - sheet_name (str or int, default 0): Name or index of the sheet to
-        read.
+        Parses the UPI narrations of the column, the remaining ones are matched
+        against the other transaction patterns. Narrations which match nothing
+        are kept as their own transaction id.
 
         Returns:
-        - DataFrame containing the data from the specified sheet, delimited by
-        rows containing stars.
+        - DataFrame with one column per extracted field, null where the
+        field does not apply to the row.
         """
-        if self.invalid_init:
-            raise ValueError("No valid file paths were provided.")
-        try:
-            transaction_tables = []
-            for file_path in self.file_paths:
-                all_data = self._read_all_data(file_path)
-                start_row = self._find_start_row(all_data)
-                end_row = self._find_end_row(all_data, (start_row or 0) + 1)
-
-                if start_row is not None and end_row is not None:
-                    log.debug(f"Start row: {start_row}")
-                    log.debug(f"End row: {end_row}")
-                    transaction_tables.append(
-                        self._extract_table_data(file_path, start_row, end_row)
-                    )
-                    log.debug(
-                        f"{len(transaction_tables[-1])} Transactions read from file: {file_path}"
-                    )
-                else:
-                    raise ValueError(
-                        "Could not find start and/or end row of the table."
-                    )
-            return self._combine_dataframes(transaction_tables)
-        except Exception as e:
-            raise Exception(f"An error occurred while reading the Excel file: {e}")
-
-    def _extract_narration_info(self, narration):
-        extracted_info = {}
-
-        try:
-            extracted_info = self._extract_upi_info(narration)
-        except Exception as e:
-            log.debug(f"Error parsing UPI string: {e}")
-            extracted_info = self._extract_other_transactions(narration)
-
-        if len(extracted_info) == 0:
-            log.debug(f"No pattern matched for narration: {narration}")
-            extracted_info["transaction_id"] = narration
+        upi_info = self._extract_upi_info(narrations)
+        other_info = self._extract_other_transactions(narrations.drop(upi_info.index))
+        info = pd.concat([upi_info, other_info]).reindex(narrations.index)
 
-        return extracted_info
+        unmatched = info.isna().all(axis=1)
+        if unmatched.any():
+            log.debug(f"No pattern matched for {unmatched.sum()} narrations")
+        info.loc[unmatched, "transaction_id"] = narrations[unmatched]
 
-    def _read_all_data(self, file_path, sheet_name=0):
-        return pd.read_excel(file_path, sheet_name=sheet_name, header=None)
+        return info
 
     def _find_start_row(self, all_data):
-        for index, row in all_data.iterrows():
-            if row.astype(str).str.contains("S No.").any():
-                return index  # Start from the row after the header row
-        return None
+        # Start from the row after the header row
+        mask = self._cells_matching(
+            all_data, lambda cells: cells.contains("S No.", regex=False)
+        )
+        return self._first_row(mask)
 
     def _find_end_row(self, all_data, start_row):
-        for index, row in all_data.iterrows():
-            if index > start_row and row.str.contains("Legends").any():
-                # End at the row before the stars row after the table
-                return index - 1
-        return None
-
-    def _convert_to_datetime(self, df, columns):
-        """
-        Convert specified columns to datetime format using the given date
-        format.
-        """
-        date_format = "%d/%m/%Y"
-        for col in columns:
-            df[col] = pd.to_datetime(df[col], format=date_format, errors="coerce")
-        return df
+        # End at the row before the legends row after the table
+        mask = self._cells_matching(
+            all_data, lambda cells: cells.contains("Legends", regex=False)
+        )
+        end_row = self._first_row(mask, after=start_row)
+        return end_row - 1 if end_row is not None else None
 
-    def _convert_to_numeric(self, df, columns, fill_value=0):
+    def _concatenate_overflowing_rows(self, df):
         """
-        Convert specified columns to numeric data type.
+        Remarks which don't fit in a row overflow into the following rows,
+        which have every other column empty. Joins each chain of such rows
+        into the remarks of the transaction row above it.
         """
-        for col in columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-            df[col] = df[col].fillna(fill_value)
-        return df
-
-    def _concatenate_overflowing_rows(self, df):
-        for index, row in df.iterrows():
-            # Check if there are NaN values in the row
-            if row.isnull().any():
-                df.at[index - 1, "Transaction Remarks"] += row["Transaction Remarks"]
+        # Rows with NaN values continue the remarks of the row above
+        is_overflow = df.isnull().any(axis=1)
+        transaction_number = (~is_overflow).cumsum()
+
+        remarks = (
+            df["Transaction Remarks"]
+            .fillna("")
+            .astype(str)
+            .groupby(transaction_number)
+            .agg("".join)
+        )
 
-        df.dropna(inplace=True)
+        df = df[~is_overflow].copy()
+        df["Transaction Remarks"] = remarks.loc[
+            transaction_number[~is_overflow]
+        ].to_numpy()
 
         return df
 
-    def _extract_table_data(self, file_path, start_row, end_row, sheet_name=0):
-        df = pd.read_excel(
-            file_path,
-            sheet_name=sheet_name,
-            skiprows=start_row,
-            nrows=end_row - start_row,
-        )
+    def _extract_table_data(self, all_data, start_row, end_row):
+        df = self._slice_table(all_data, start_row, end_row)
 
         df = df.drop(df.columns[0], axis=1)
 
@@ -135,7 +104,9 @@ class IciciExcelDataReader:
         df = self._concatenate_overflowing_rows(df)
 
         # Convert to relevant data types
-        df = self._convert_to_datetime(df, ["Value Date", "Transaction Date"])
+        df = self._convert_to_datetime(
+            df, ["Value Date", "Transaction Date"], self.date_format
+        )
 
         return df
 
@@ -144,11 +115,10 @@ class IciciExcelDataReader:
         combined_df.reset_index(drop=True, inplace=True)
         combined_df.drop_duplicates(inplace=True)
 
-        combined_df["ExtractedInfo"] = combined_df["Transaction Remarks"].apply(
-            self._extract_narration_info
-        )
+        info = self._extract_narration_info(combined_df["Transaction Remarks"])
+        combined_df["ExtractedInfo"] = self._to_extracted_info(info)
         combined_df["_id"] = (
-            combined_df["ExtractedInfo"].apply(lambda x: x.get("transaction_id"))
+            info["transaction_id"]
             + combined_df["Withdrawal Amount (INR )"].astype(str)
             + combined_df["Deposit Amount (INR )"].astype(str)
         )
@@ -169,9 +139,9 @@ class IciciExcelDataReader:
 
         return combined_df
 
-    def _extract_upi_info(self, upi_string: str) -> dict:
+    def _extract_upi_info(self, narrations: pd.Series) -> pd.DataFrame:
         """
-        Parses an UPI string
+        Parses the UPI strings of the column, segments separated by "/"
         1. "UPI"
         1. upi txn number if all digits or UPI id receiver
         1. "UPI" or transaction Message
@@ -179,74 +149,61 @@ class IciciExcelDataReader:
         1. if contains bank then bank id otherwise transaction number
         1. Transaction ID with bank, check for empty strings
 
+        Only narrations with exactly 6 segments and "UPI" as the first one are
+        part of the result.
         """
-        segments = upi_string.split("/")
-
-        # Check for exactly 6 segments
-        if len(segments) != 6:
-            raise ValueError("Invalid UPI string: Exactly 6 segments required. " + upi_string)
-
-        # Verify that the first segment is "UPI" for sanity check
-        if segments[0] != "UPI":
-            raise ValueError("Invalid UPI string: First segment must be 'UPI'. " + upi_string)
-
-        # Initialize result dictionary
-        result = {}
+        is_upi = (narrations.str.count("/") == 5) & narrations.str.startswith(
+            "UPI/", na=False
+        )
+        segments = narrations[is_upi].str.split("/", expand=True)
+        result = pd.DataFrame(index=segments.index, columns=INFO_FIELDS, dtype=object)
+        if segments.empty:
+            return result
 
-        # Process each segment based on the specified conditions
         # Element 1: Check if all digits, add as "transaction_id" or as "receiverID"
-        result["transaction_id" if segments[1].isdigit() else "beneficiary_details"] = (
-            segments[1]
-        )
+        is_txn_number = segments[1].str.isdigit()
+        result["transaction_id"] = segments[1].where(is_txn_number)
+        result["beneficiary_details"] = segments[1].where(~is_txn_number)
 
         # Element 2: If not "UPI", add as "message"
-        if segments[2] != "UPI":
-            result["message"] = segments[2]
+        result["message"] = segments[2].where(segments[2] != "UPI")
 
         # Element 3: Check for "bank" (case-insensitive) to determine if "receiver bank" or "receiverID"
-        if "bank" in segments[3].lower():
-            result["beneficiary_bank"] = segments[3]
-        else:
-            result["beneficiary_details"] = segments[3]
+        is_bank = segments[3].str.lower().str.contains("bank", regex=False)
+        result["beneficiary_bank"] = segments[3].where(is_bank)
+        result["beneficiary_details"] = segments[3].where(
+            ~is_bank, result["beneficiary_details"]
+        )
 
         # Element 4: Check for "bank" (case-insensitive) to determine if "receiver bank" or "txn number"
-        if "bank" in segments[4].lower():
-            result["beneficiary_bank"] = segments[4]
-        else:
-            result["transaction_id"] = segments[4]
+        is_bank = segments[4].str.lower().str.contains("bank", regex=False)
+        result["beneficiary_bank"] = segments[4].where(
+            is_bank, result["beneficiary_bank"]
+        )
+        result["transaction_id"] = segments[4].where(~is_bank, result["transaction_id"])
 
         # Element 5: Add as "bankTxnId" if not empty
-        if segments[5]:
-            result["bank_txn_id"] = segments[5]
+        result["bank_txn_id"] = segments[5].where(segments[5] != "")
 
         return result
 
-    def _extract_other_transactions(self, narration):
-        # Define patterns for different types of transactions (and they may expand)
-        patterns = {
-            "NEFT": r"NEFT-(.*?)-(.*?)-(.*)",
-            "Interest": r"(\d+):Int\.Pd:(\d{2}-\d{2}-\d{4}) to (\d{2}-\d{2}-\d{4})",
-        }
-
-        extracted_info = {}
-
-        # Iterate through patterns and extract information
-        for key, pattern in patterns.items():
-            match = re.search(pattern, narration)
-            if match:
-                extracted_info["type"] = key
-                if key == "UPI":
-                    extracted_info["transaction_id"] = match.group(1)
-                    extracted_info["message"] = match.group(2)
-                    extracted_info["sender_receiver_details"] = match.group(3)
-                    extracted_info["bank_name"] = match.group(4)
-                elif key == "NEFT":
-                    extracted_info["sender_bank"] = match.group(2)
-                    extracted_info["transaction_id"] = match.group(1)
-                    extracted_info["details"] = match.group(3)
-                elif key == "Interest":
-                    extracted_info["transaction_id"] = match.group(1)
-                    extracted_info["start_date"] = match.group(2)
-                    extracted_info["end_date"] = match.group(3)
+    def _extract_other_transactions(self, narrations: pd.Series) -> pd.DataFrame:
+        extracted_info = pd.DataFrame(
+            index=narrations.index, columns=INFO_FIELDS, dtype=object
+        )
+
+        # Match every pattern against the whole column, a later pattern wins
+        for key, pattern in NARRATION_PATTERNS.items():
+            match = narrations.str.extract(pattern)
+            matched = match[0].notna()
+            extracted_info.loc[matched, "type"] = key
+            if key == "NEFT":
+                extracted_info.loc[matched, "sender_bank"] = match.loc[matched, 1]
+                extracted_info.loc[matched, "transaction_id"] = match.loc[matched, 0]
+                extracted_info.loc[matched, "details"] = match.loc[matched, 2]
+            elif key == "Interest":
+                extracted_info.loc[matched, "transaction_id"] = match.loc[matched, 0]
+                extracted_info.loc[matched, "start_date"] = match.loc[matched, 1]
+                extracted_info.loc[matched, "end_date"] = match.loc[matched, 2]
 
         return extracted_info
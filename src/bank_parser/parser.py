@@ -0,0 +1,214 @@
+import pandas as pd
+from src.parse_cache import file_content_hash, parse_cache
+from src.utils import get_logger
+from abc import abstractmethod, ABCMeta
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from typing import Dict, Iterator, Optional
+
+log = get_logger(__name__)
+
+
+class ExcelDataReader:
+    __metaclass__ = ABCMeta
+    invalid_init = False
+
+    # bump when the parsed tables change, cached tables of older versions are ignored
+    parser_version = 1
+
+    def __init__(
+        self,
+        file_paths: list[str],
+        workers: Optional[int] = 1,
+        content_hashes: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Args:
+        - file_paths (list[str]): Statement files to read, files inside `.old`
+        folders are ignored.
+        - workers (int, optional): Number of processes used to parse the files,
+        `1` parses them in the calling process and `None` uses one process per
+        CPU. Defaults to 1.
+        - content_hashes (dict, optional): `file_content_hash` of the files by
+        path, e.g. from the file inventory, the files missing from it are
+        hashed for the parse cache.
+        """
+        self.file_paths = [
+            file_path for file_path in file_paths if "old" not in file_path
+        ]
+        self.workers = workers
+        self.content_hashes = content_hashes or {}
+
+        if len(self.file_paths) == 0:
+            self.invalid_init = True
+
+    def read_data(self, sheet_name=0) -> pd.DataFrame:
+        """
+        Read data from the specified sheet of the Excel file, starting from
+        the row after the header row,
+        and ending at the row before the row containing stars after the table.
+
+        Every workbook is decoded only once, the table is sliced out of the
+        in-memory sheet. Files are parsed in a process pool when more than one
+        worker is configured, the tables are combined in `file_paths` order.
+
+        Args:
+        - sheet_name (str or int, default 0): Name or index of the sheet to
+        read.
+
+        Returns:
+        - DataFrame containing the data from the specified sheet, delimited by
+        rows containing stars.
+        """
+        if self.invalid_init:
+            raise ValueError("No valid file paths were provided.")
+        try:
+            if self.workers == 1 or len(self.file_paths) == 1:
+                transaction_tables = [
+                    self._read_file(file_path, sheet_name)
+                    for file_path in self.file_paths
+                ]
+            else:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    # map keeps the input order so the combined frame is deterministic
+                    transaction_tables = list(
+                        executor.map(
+                            self._read_file,
+                            self.file_paths,
+                            repeat(sheet_name),
+                        )
+                    )
+
+            return self._combine_dataframes(transaction_tables)
+        except Exception as e:
+            raise Exception(f"An error occurred while reading the Excel file: {e}")
+
+    def read_batches(self, batch_size: int, sheet_name=0) -> Iterator[pd.DataFrame]:
+        """
+        Same transactions as `read_data`, yielded in frames of at most
+        `batch_size` rows. Files are parsed one after another so only a single
+        statement is held in memory, duplicates are dropped within each file.
+        """
+        if self.invalid_init:
+            raise ValueError("No valid file paths were provided.")
+        for file_path in self.file_paths:
+            try:
+                df = self._combine_dataframes([self._read_file(file_path, sheet_name)])
+            except Exception as e:
+                raise Exception(f"An error occurred while reading the Excel file: {e}")
+
+            for start in range(0, len(df), batch_size):
+                yield df.iloc[start : start + batch_size]
+
+    def _read_file(self, file_path, sheet_name=0) -> pd.DataFrame:
+        return parse_cache.get_or_parse(
+            f"{type(self).__name__}:{sheet_name}",
+            self.parser_version,
+            [self._get_content_hash(file_path)],
+            partial(self._parse_file, file_path, sheet_name),
+        )
+
+    def _get_content_hash(self, file_path) -> str:
+        content_hash = self.content_hashes.get(file_path)
+        return content_hash or file_content_hash(file_path)
+
+    def _parse_file(self, file_path, sheet_name=0) -> pd.DataFrame:
+        try:
+            all_data = self._read_all_data(file_path, sheet_name)
+            start_row = self._find_start_row(all_data)
+            end_row = self._find_end_row(all_data, (start_row or 0) + 1)
+
+            if start_row is None or end_row is None:
+                raise ValueError("Could not find start and/or end row of the table.")
+
+            log.debug(f"Start row: {start_row}")
+            log.debug(f"End row: {end_row}")
+            table = self._extract_table_data(all_data, start_row, end_row)
+        except Exception as e:
+            raise ValueError(f"{file_path}: {e}") from e
+
+        log.debug(f"{len(table)} Transactions read from file: {file_path}")
+        return table
+
+    @abstractmethod
+    def _find_start_row(self, all_data: pd.DataFrame):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _find_end_row(self, all_data: pd.DataFrame, start_row: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _extract_table_data(
+        self, all_data: pd.DataFrame, start_row: int, end_row: int
+    ) -> pd.DataFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _combine_dataframes(self, dfs: list[pd.DataFrame]) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def _read_all_data(self, file_path, sheet_name=0):
+        return pd.read_excel(file_path, sheet_name=sheet_name, header=None)
+
+    def _cells_matching(self, all_data: pd.DataFrame, matcher) -> pd.Series:
+        """
+        Returns a boolean mask over the rows of the sheet which have at least
+        one cell for which `matcher(column.str)` is true.
+        """
+        cells = all_data.astype(str)
+        return cells.apply(lambda column: matcher(column.str)).any(axis=1)
+
+    def _first_row(self, mask: pd.Series, after: int = -1):
+        """
+        Position of the first row after `after` for which the mask is set.
+        """
+        mask = mask.to_numpy(dtype=bool, copy=True)
+        mask[: after + 1] = False
+        if not mask.any():
+            return None
+        return int(mask.argmax())
+
+    def _slice_table(self, all_data: pd.DataFrame, start_row: int, end_row: int):
+        """
+        Same frame as `pd.read_excel(skiprows=start_row, nrows=end_row - start_row)`
+        would return, cut out of the already decoded sheet.
+        """
+        header = [
+            f"Unnamed: {idx}" if pd.isna(name) else name
+            for idx, name in enumerate(all_data.iloc[start_row])
+        ]
+        df = all_data.iloc[start_row + 1 : end_row + 1].copy()
+        df.columns = header
+        df.reset_index(drop=True, inplace=True)
+        return df.infer_objects()
+
+    def _to_extracted_info(self, info: pd.DataFrame) -> pd.Series:
+        """
+        Turns the column-wise narration fields into the `ExtractedInfo` dicts,
+        keeping only the fields which were found for each row.
+        """
+        records = [
+            {key: value for key, value in record.items() if pd.notna(value)}
+            for record in info.to_dict(orient="records")
+        ]
+        return pd.Series(records, index=info.index, dtype=object)
+
+    def _convert_to_datetime(self, df, columns, date_format):
+        """
+        Convert specified columns to datetime format using the given date
+        format.
+        """
+        for col in columns:
+            df[col] = pd.to_datetime(df[col], format=date_format, errors="coerce")
+        return df
+
+    def _convert_to_numeric(self, df, columns, fill_value=0):
+        """
+        Convert specified columns to numeric data type.
+        """
+        for col in columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+            df[col] = df[col].fillna(fill_value)
+        return df
@@ -1,4 +1,5 @@
-from src.db.mongo_connector import MongoConnector
+from src.db.mongo_connector import LazyDatabase, MongoConnector
 
-mongo_connector = MongoConnector()
-mongo = mongo_connector.get_database("financials")
+# Nothing connects on import, the client is created by the first query
+mongo_connector = MongoConnector.from_env()
+mongo = LazyDatabase(mongo_connector, "financials")
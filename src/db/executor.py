@@ -0,0 +1,40 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# Threads running blocking pymongo calls for the async routes, at most this
+# many queries of the web app are in flight at once
+DB_EXECUTOR_WORKERS = 8
+
+db_executor = ThreadPoolExecutor(
+    max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="mongo"
+)
+
+# Ingestion parses files and writes in bulk for a long time, it gets its own
+# thread so it never takes the query threads away from the dashboard
+ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+
+
+async def run_in_db_executor(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Runs a blocking database call on `db_executor` without blocking the
+    event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
+
+
+async def iterate_in_db_executor(iterator: Iterator[T]) -> AsyncIterator[T]:
+    """
+    Pulls the items of a blocking iterator, e.g. a cursor or a generator
+    reading one, on `db_executor`, one item per call.
+    """
+    done = object()
+    while True:
+        item = await run_in_db_executor(next, iterator, done)
+        if item is done:
+            return
+        yield item
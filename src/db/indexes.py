@@ -0,0 +1,107 @@
+from typing import Dict, Iterator, List, Optional
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+from src.db import mongo
+from src.service.summary import SummaryService
+from src.service.transactions import TransactionService
+from src.service.vendor import Vendor
+from src.service.vendor_matching import VendorMatchingService
+from src.utils import get_logger
+
+log = get_logger(__name__)
+
+
+def get_index_declarations() -> Dict[str, List[IndexModel]]:
+    """
+    Indexes declared by the services, by collection name.
+    """
+    return {
+        "transactions": TransactionService.indexes,
+        "transaction_summary": SummaryService.indexes,
+        **Vendor.get_index_declarations(),
+    }
+
+
+def ensure_indexes(
+    declarations: Optional[Dict[str, List[IndexModel]]] = None
+) -> Dict[str, List[str]]:
+    """
+    Creates the declared indexes which do not exist yet, existing indexes with
+    the same keys and options are left alone.
+
+    Args:
+        declarations (dict, optional): Indexes by collection name, defaults to
+            every index declared by the services.
+
+    Returns:
+        dict: Names of the ensured indexes by collection name.
+    """
+    if declarations is None:
+        declarations = get_index_declarations()
+
+    ensured = {}
+    for collection_name, indexes in declarations.items():
+        try:
+            ensured[collection_name] = mongo[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            # an index with the same keys but other options was made by hand
+            log.warning(f"Could not create indexes on {collection_name}: {e}")
+    log.info(f"Ensured indexes: {ensured}")
+    return ensured
+
+
+def get_query_shapes() -> Iterator[tuple[str, str, dict, Optional[list], bool]]:
+    """
+    `(collection, name, filter, sort, full_load)` of every query shape the
+    services send, `full_load` marks the ones meant to read most of their
+    collection.
+    """
+    transaction_service = TransactionService()
+    vendor_matcher = VendorMatchingService()
+    for name, query, sort in transaction_service.get_query_shapes():
+        yield "transactions", name, query, sort, False
+    for phrase in Vendor.vendor_list:
+        if Vendor.get_parser(phrase) is None:
+            continue
+        collection_name = Vendor.get_collection(phrase).name
+        for name, query, sort in Vendor.get_query_shapes(phrase):
+            yield collection_name, name, query, sort, False
+        yield from vendor_matcher.get_query_shapes(phrase)
+
+
+def get_plan_stages(plan: dict) -> List[str]:
+    """
+    Stages of a query plan from the root down, e.g. `["FETCH", "IXSCAN"]`.
+    """
+    stages = [plan["stage"]]
+    for child in [plan.get("inputStage"), *plan.get("inputStages", [])]:
+        if child:
+            stages.extend(get_plan_stages(child))
+    return stages
+
+
+def explain_query_shapes() -> List[str]:
+    """
+    Runs `explain` on every query shape and logs the winning plan.
+
+    Returns:
+        list[str]: Names of the query shapes which scan a whole collection
+        without being meant to load most of it.
+    """
+    collection_scans = []
+    for collection_name, name, query, sort, full_load in get_query_shapes():
+        cursor = mongo[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        # plans of newer servers are nested in the execution engine's plan
+        stages = get_plan_stages(plan.get("queryPlan", plan))
+
+        if "COLLSCAN" in stages and not full_load:
+            collection_scans.append(f"{collection_name}: {name}")
+            log.warning(f"COLLSCAN {collection_name}: {name} {' <- '.join(stages)}")
+        else:
+            log.info(f"{collection_name}: {name} {' <- '.join(stages)}")
+    return collection_scans
@@ -1,12 +1,126 @@
+import os
+import threading
+import time
+from typing import Optional
+
 from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+# Connection settings read by `MongoConnector.from_env`, unset ones keep the
+# pymongo defaults
+MONGO_ENV_PREFIX = "FINANCIALS_MONGO_"
+MONGO_INT_SETTINGS = {
+    "PORT": "port",
+    "MAX_POOL_SIZE": "maxPoolSize",
+    "MIN_POOL_SIZE": "minPoolSize",
+    "MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Counts the connections checked out of the pool and how long callers
+    waited for them, use it to size `maxPoolSize` under load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # check outs happen on the thread running the operation
+        self._waits = threading.local()
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.check_outs = 0
+        self.check_out_failures = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.connections_created = 0
+        self.connections_closed = 0
+
+    def connection_check_out_started(self, event):
+        self._waits.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_time = time.perf_counter() - getattr(
+            self._waits, "started", time.perf_counter()
+        )
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.check_outs += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.check_out_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "check_outs": self.check_outs,
+                "check_out_failures": self.check_out_failures,
+                "open_connections": self.connections_created - self.connections_closed,
+                "avg_wait_ms": (
+                    round(self.total_wait_time / self.check_outs * 1e3, 3)
+                    if self.check_outs
+                    else 0.0
+                ),
+                "max_wait_ms": round(self.max_wait_time * 1e3, 3),
+            }
 
 
 class MongoConnector:
     """
-    A class to connect to a MongoDB database with automatic closing on deletion.
+    A class to connect to a MongoDB database. The client is created on first
+    use and closed by `close_connection`, the app does it on shutdown.
     """
 
-    def __init__(self, host="localhost", port=27017, username=None, password=None):
+    def __init__(
+        self,
+        host="localhost",
+        port=27017,
+        username=None,
+        password=None,
+        read_concern: Optional[str] = None,
+        write_concern: Optional[str] = None,
+        **client_options,
+    ):
         """
         Initializes the connection to the MongoDB database.
 
@@ -15,21 +129,89 @@ class MongoConnector:
           port (int, optional): The port number of the MongoDB server. Defaults to 27017.
           username (str, optional): The username for authentication (if required). Defaults to None.
           password (str, optional): The password for authentication (if required). Defaults to None.
+          read_concern (str, optional): Read concern level of the databases, e.g. "majority".
+          write_concern (str, optional): Write concern `w` of the databases, e.g. "majority" or "1".
+          client_options: Passed on to `MongoClient`, e.g. `maxPoolSize` or `serverSelectionTimeoutMS`.
         """
-        connectionString = (
+        self.connectionString = (
             f"mongodb://{username}:{password}@{host}:{port}/"
             if username and password
             else f"mongodb://{host}:{port}/"
         )
-        self.client = MongoClient(connectionString)
-        self.db = None
+        self.read_concern = read_concern
+        self.write_concern = write_concern
+        self.client_options = client_options
+        self.pool_metrics = PoolMetrics()
+        self._client: Optional[MongoClient] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "MongoConnector":
+        """
+        Connector configured by the `FINANCIALS_MONGO_*` environment variables:
+        `HOST`, `PORT`, `USERNAME`, `PASSWORD`, `READ_CONCERN`, `WRITE_CONCERN`
+        and the pool and timeout settings in `MONGO_INT_SETTINGS`.
+        """
+        settings = {}
+        for name in ("HOST", "USERNAME", "PASSWORD", "READ_CONCERN", "WRITE_CONCERN"):
+            value = os.environ.get(MONGO_ENV_PREFIX + name)
+            if value:
+                settings[name.lower()] = value
+        for name, option in MONGO_INT_SETTINGS.items():
+            value = os.environ.get(MONGO_ENV_PREFIX + name)
+            if value:
+                settings[option] = int(value)
+        return cls(**settings)
 
-    def get_database(self, database_name):
-        return self.client[database_name]
+    @property
+    def client(self) -> MongoClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = MongoClient(
+                        self.connectionString,
+                        event_listeners=[self.pool_metrics],
+                        **self.client_options,
+                    )
+        return self._client
+
+    def get_database(self, database_name) -> Database:
+        write_concern = None
+        if self.write_concern:
+            w = self.write_concern
+            write_concern = WriteConcern(w=int(w) if w.isdigit() else w)
+        return self.client.get_database(
+            database_name,
+            read_concern=ReadConcern(self.read_concern) if self.read_concern else None,
+            write_concern=write_concern,
+        )
 
     def close_connection(self):
         """
-        Closes the connection to the MongoDB database when the object is garbage collected.
+        Closes the connection to the MongoDB database, the next use connects
+        again.
         """
-        if self.client:
-            self.client.close()
+        with self._lock:
+            if self._client:
+                self._client.close()
+                self._client = None
+
+
+class LazyDatabase:
+    """
+    Stands in for a `Database` which is only looked up, and connected to, when
+    a collection or attribute is first used.
+    """
+
+    def __init__(self, connector: MongoConnector, database_name: str):
+        self._connector = connector
+        self._database_name = database_name
+
+    def _get_database(self) -> Database:
+        return self._connector.get_database(self._database_name)
+
+    def __getitem__(self, collection_name: str):
+        return self._get_database()[collection_name]
+
+    def __getattr__(self, name: str):
+        return getattr(self._get_database(), name)
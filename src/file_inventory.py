@@ -0,0 +1,240 @@
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+from src.parse_cache import file_content_hash
+from src.service.vendor import Vendor
+from src.utils import get_logger
+
+try:
+    # change notifications, without it the folders are rescanned on a timer
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+log = get_logger(__name__)
+
+# Folders the input files are dropped in, by source
+INPUT_FOLDERS = {
+    "hdfc": r"bank_transactions\hdfc_data",
+    "icici": r"bank_transactions\icici_data",
+    "zomato": Vendor.get_data_folder("zomato"),
+    "zepto": Vendor.get_data_folder("zepto"),
+    "eatSure": Vendor.get_data_folder("eatSure"),
+}
+
+# Seconds between two scans of the folders when watchdog is not installed
+POLL_INTERVAL = 30
+
+
+class FileInfo(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+
+
+class FileInventory:
+    """
+    Keeps the files of the input folders in memory so reading them does not
+    walk the folders, which is slow on a network drive.
+
+    Once started the folders are watched with watchdog when it is installed,
+    a change marks its folder for a rescan on the next read, otherwise a
+    background thread rescans them every `poll_interval` seconds. Without
+    `start` every read scans the folders again. Content hashes are computed on
+    demand and kept while the size and mtime of the file stay the same.
+    """
+
+    def __init__(
+        self,
+        folders: Optional[Dict[str, str]] = None,
+        poll_interval: float = POLL_INTERVAL,
+    ):
+        self.folders = dict(INPUT_FOLDERS if folders is None else folders)
+        self.poll_interval = poll_interval
+        self._files: Dict[str, List[FileInfo]] = {}
+        self._dirty = set(self.folders)
+        self._hashes: Dict[FileInfo, str] = {}
+        self._lock = threading.Lock()
+        self._observer = None
+        # sources whose folder the observer watches
+        self._watched = set()
+        self._poller: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def watching(self) -> bool:
+        return self._observer is not None or self._poller is not None
+
+    def start(self):
+        if self.watching:
+            return
+        self._stopped.clear()
+
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.daemon = True
+            self._observer.start()
+            # each scan schedules the observer on its folder first
+            self.refresh()
+            log.info("Watching the input folders for changes")
+        else:
+            self.refresh()
+            self._poller = threading.Thread(
+                target=self._poll, name="file-inventory", daemon=True
+            )
+            self._poller.start()
+            log.info(f"Scanning the input folders every {self.poll_interval}s")
+
+    def stop(self):
+        self._stopped.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+            self._watched.clear()
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+
+    def mark_dirty(self, source: Optional[str] = None):
+        """
+        Rescans the folder of `source`, or every folder, on the next read.
+        """
+        with self._lock:
+            self._dirty.update([source] if source else self.folders)
+
+    def refresh(self):
+        for source in self.folders:
+            self._scan(source)
+
+    def get_files(
+        self,
+        source: str,
+        must_contain: Optional[str] = None,
+    ) -> List[FileInfo]:
+        """
+        Files of a source's folder and its subfolders.
+
+        Args:
+            source (str): Key of `INPUT_FOLDERS`, e.g. "hdfc" or "zomato".
+            must_contain (str, optional): Only the paths containing it, e.g. an
+                extension.
+        """
+        with self._lock:
+            files = None if source in self._dirty else self._files.get(source)
+        if files is None or not self.watching:
+            files = self._scan(source)
+
+        return [
+            file
+            for file in files
+            if (must_contain is None or must_contain in file.path)
+            and "old" not in file.path
+        ]
+
+    def get_paths(self, source: str, *args, **kwargs) -> List[str]:
+        return [file.path for file in self.get_files(source, *args, **kwargs)]
+
+    def get_content_hash(self, file: FileInfo) -> str:
+        with self._lock:
+            content_hash = self._hashes.get(file)
+        if content_hash is None:
+            # hashed outside the lock, reading the file may take a while
+            content_hash = file_content_hash(file.path)
+            with self._lock:
+                self._hashes[file] = content_hash
+        return content_hash
+
+    def deduplicate(self, files: List[FileInfo]) -> List[FileInfo]:
+        """
+        Drops the files with the same content as an earlier file of the list,
+        e.g. a statement downloaded twice.
+        """
+        unique_files = {}
+        for file in files:
+            content_hash = self.get_content_hash(file)
+            if content_hash in unique_files:
+                log.warning(
+                    f"Skipping {file.path}, same content as {unique_files[content_hash].path}"
+                )
+                continue
+            unique_files[content_hash] = file
+        return list(unique_files.values())
+
+    def _watch(self, source: str):
+        """
+        Schedules the observer on the folder of `source` once it exists, a
+        missing folder stays dirty and is scanned on every read until then.
+        """
+        folder = self.folders[source]
+        observer = self._observer
+        if observer is None or not os.path.isdir(folder):
+            return
+        with self._lock:
+            if source in self._watched:
+                return
+            self._watched.add(source)
+        # scheduled outside the lock, the observer holds its own lock while
+        # dispatching to `mark_dirty`
+        try:
+            observer.schedule(_MarkDirty(self, source), folder, recursive=True)
+        except OSError as e:
+            log.warning(f"Could not watch {folder}: {e}")
+            with self._lock:
+                self._watched.discard(source)
+
+    def _scan(self, source: str) -> List[FileInfo]:
+        folder = self.folders[source]
+        # watched before walking so a change made meanwhile marks it again
+        self._watch(source)
+        with self._lock:
+            # a change seen while walking marks the folder again
+            self._dirty.discard(source)
+
+        files = []
+        for root, _, file_names in os.walk(folder):
+            for file_name in file_names:
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # moved away while walking
+                    continue
+                files.append(FileInfo(path, stat.st_size, stat.st_mtime))
+
+        with self._lock:
+            self._files[source] = files
+            if not os.path.isdir(folder):
+                self._dirty.add(source)
+            # forget the hashes of files which changed or are gone
+            current = {file for known in self._files.values() for file in known}
+            self._hashes = {
+                file: content_hash
+                for file, content_hash in self._hashes.items()
+                if file in current
+            }
+        return files
+
+    def _poll(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                log.warning(f"Could not scan the input folders: {e}")
+
+
+class _MarkDirty:
+    """
+    Watchdog event handler marking the folder of a source for a rescan.
+    """
+
+    def __init__(self, inventory: FileInventory, source: str):
+        self.inventory = inventory
+        self.source = source
+
+    def dispatch(self, event):
+        self.inventory.mark_dirty(self.source)
+
+
+file_inventory = FileInventory()
@@ -0,0 +1,153 @@
+import json
+import re
+from typing import Iterator
+
+JSON_STREAM_CHUNK_SIZE = 1024 * 1024
+
+_whitespace = re.compile(r"\s*")
+
+
+class JsonStream:
+    """
+    Reads json values one at a time out of a file, only the value being
+    decoded and a chunk of the file are held in memory.
+    """
+
+    def __init__(self, file, chunk_size: int = JSON_STREAM_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        # read at least as much as is buffered so a value spanning many chunks
+        # is decoded a logarithmic number of times
+        chunk = self.file.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Next character after any whitespace, empty at the end of the file.
+        """
+        while True:
+            self.pos = _whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(
+                f"Expected '{char}' but found '{found or 'end of file'}' in {self.file.name}"
+            )
+        self.pos += 1
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # the value may continue in the part of the file not read yet
+                if self._fill():
+                    continue
+                raise ValueError(f"{self.file.name} is not a json: {e}")
+
+            # a number at the end of the buffer may be cut off
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def iter_members(self) -> Iterator[str]:
+        """
+        Yields the keys of the object starting at the current position, the
+        caller must consume each value before asking for the next key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def iter_elements(self) -> Iterator:
+        """
+        Yields the decoded values of the array or object starting at the
+        current position.
+        """
+        if self.peek() == "{":
+            for _ in self.iter_members():
+                yield self.decode_value()
+            return
+
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def iter_json_items(
+    file_path: str, path: tuple[str, ...], missing_ok: bool = False
+) -> Iterator:
+    """
+    Stream the values of the array (or object) found under `path` in a json
+    file without decoding the whole document.
+
+    Args:
+    - file_path (str): Path to the json file.
+    - path (tuple[str, ...]): Keys leading from the root object to the array.
+    - missing_ok (bool, optional): Yield nothing when the path does not exist.
+
+    Returns:
+    - Iterator over the decoded values.
+
+    Raises:
+    - KeyError: When the path does not exist in the file and not `missing_ok`.
+    """
+    with open(file_path, "r", encoding="utf-8") as file:
+        stream = JsonStream(file)
+        if not _seek_path(stream, path):
+            if missing_ok:
+                return
+            raise KeyError(f"{'.'.join(path)} not found in {file_path}")
+        yield from stream.iter_elements()
+
+
+def _seek_path(stream: JsonStream, path: tuple[str, ...]) -> bool:
+    for key in path:
+        if stream.peek() != "{":
+            return False
+        for member in stream.iter_members():
+            if member == key:
+                break
+            # skip the values of the other keys
+            stream.decode_value()
+        else:
+            return False
+    return True
@@ -0,0 +1,151 @@
+import hashlib
+import os
+from typing import Callable, Optional
+
+import pandas as pd
+
+from src.utils import get_logger
+
+log = get_logger(__name__)
+
+PARSE_CACHE_FOLDER = ".parse_cache"
+PARSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Set to "0" (what the --no-parse-cache flag does) to parse every file again
+PARSE_CACHE_ENV = "FINANCIALS_PARSE_CACHE"
+
+
+def file_content_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    Keeps parsed DataFrames on local disk, keyed by the content hash of the
+    input files and the name and version of the parser which produced them.
+
+    Frames are stored as pandas pickles, the parsed columns hold nested dicts
+    and lists (`ExtractedInfo`, order `items`) which columnar formats would
+    not give back unchanged. The least recently used entries are evicted once
+    the folder grows over `max_bytes`.
+    """
+
+    def __init__(
+        self, folder: str = PARSE_CACHE_FOLDER, max_bytes: int = PARSE_CACHE_MAX_BYTES
+    ):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return os.environ.get(PARSE_CACHE_ENV, "1") != "0"
+
+    def get_key(self, parser_name: str, version: int, content_hashes: list[str]) -> str:
+        digest = hashlib.sha256(f"{parser_name}:{version}".encode())
+        for content_hash in content_hashes:
+            digest.update(content_hash.encode())
+        return digest.hexdigest()
+
+    def get_or_parse(
+        self,
+        parser_name: str,
+        version: int,
+        content_hashes: list[str],
+        parse: Callable[[], pd.DataFrame],
+    ) -> pd.DataFrame:
+        """
+        Returns the cached frame for the files when their content was parsed
+        before by the same parser version, otherwise calls `parse` and stores
+        its result.
+
+        Args:
+            parser_name (str): Name of the parser.
+            version (int): Version of the parser.
+            content_hashes (list[str]): `file_content_hash` of the input files
+                in parsing order, the file inventory already has them so the
+                files are not read again to build the key.
+            parse (Callable): Parses the files.
+        """
+        if not self.enabled or not content_hashes:
+            return parse()
+
+        key = self.get_key(parser_name, version, content_hashes)
+        df = self.load(key)
+        if df is not None:
+            log.debug(f"Parse cache hit for {parser_name}: {key}")
+            return df
+
+        df = parse()
+        self.store(key, df)
+        return df
+
+    def load(self, key: str) -> Optional[pd.DataFrame]:
+        path = self._get_path(key)
+        try:
+            df = pd.read_pickle(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"Dropping unreadable parse cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+        # mark as recently used for the eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return df
+
+    def store(self, key: str, df: pd.DataFrame):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._get_path(key)
+
+        # write under a temporary name so readers never see half a file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            df.to_pickle(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log.warning(f"Could not write parse cache entry {path}: {e}")
+            self._remove(tmp_path)
+            return
+
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith(".pkl"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # removed by a parser running in another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            log.debug(f"Evicting parse cache entry {path}")
+            self._remove(path)
+            total_size -= size
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.pkl")
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+parse_cache = ParseCache()
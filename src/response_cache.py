@@ -0,0 +1,154 @@
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, NamedTuple, Optional
+
+from src.utils import get_logger
+
+log = get_logger(__name__)
+
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# `(year, month)` of the transactions a cached response shows, `None` for all
+CacheMonth = Optional[tuple[int, int]]
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    size: int
+    month: CacheMonth
+    # indicator value of the transactions shown, `None` for every indicator
+    indicator: Optional[str]
+
+
+def get_cache_month(date: Optional[datetime]) -> CacheMonth:
+    return (date.year, date.month) if date else None
+
+
+class ResponseCache:
+    """
+    Keeps rendered pages and query results in memory, keyed by the request
+    parameters, and evicts the least recently used ones once they take more
+    than `max_bytes`.
+
+    Every entry records the month and indicator of the transactions it shows
+    so an update only drops the entries which can contain the transaction,
+    `clear` drops everything after an ingestion. Values computed while an
+    invalidation happened are not stored, they may predate the write.
+
+    The cache lives in the server process. Writes made by another process,
+    e.g. the `retag` and `rebuild-summary` commands, do not reach it, the
+    server shows the previous data until its next ingestion or a restart.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        # bumped by every invalidation
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        generation: int,
+        month: CacheMonth = None,
+        indicator: Optional[str] = None,
+    ):
+        """
+        Args:
+            key (Hashable): The request parameters.
+            value (Any): A page (`str`) or a picklable query result.
+            generation (int): `generation` read before computing the value.
+            month (tuple, optional): `(year, month)` of the transactions shown,
+                `None` when it shows every month.
+            indicator (str, optional): Indicator of the transactions shown,
+                `None` when it shows every indicator.
+        """
+        if isinstance(value, (str, bytes)):
+            size = len(value)
+        else:
+            size = len(pickle.dumps(value))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._remove(key)
+            self._entries[key] = CacheEntry(value, size, month, indicator)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.evictions += 1
+
+    def invalidate(self, date: Optional[datetime], indicator: Optional[str]):
+        """
+        Drops the entries which may show transactions valued on `date` with
+        `indicator`.
+        """
+        month = get_cache_month(date)
+        with self._lock:
+            self.generation += 1
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if (entry.month is None or month is None or entry.month == month)
+                and (
+                    entry.indicator is None
+                    or indicator is None
+                    or entry.indicator == indicator
+                )
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+        log.debug(f"Invalidated {len(stale)} cached responses of {month} {indicator}")
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._size = 0
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+
+response_cache = ResponseCache()
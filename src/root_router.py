@@ -1,40 +1,82 @@
 import datetime
 import time
 from functools import partial
-from typing import Optional, Literal
+from typing import Any, Callable, Iterator, Optional, Literal
 
 import pandas as pd
-from fastapi import APIRouter, Form, Request
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Form, HTTPException, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
 from jinja2 import Environment, FileSystemLoader
-from jinjax.catalog import Catalog
-
-from src.service.data_ingestion import DataIngestionService
-from src.service.transactions import TransactionIndicator, TransactionService
+from starlette.concurrency import run_in_threadpool
+
+from src.db import mongo_connector
+from src.db.executor import iterate_in_db_executor
+from src.file_inventory import INPUT_FOLDERS, file_inventory
+from src.response_cache import get_cache_month, response_cache
+from src.service.ingestion_jobs import IngestionJobConflict, ingestion_jobs
+from src.service.transactions import AsyncTransactionService, TransactionIndicator
 from src.service.vendor import Vendor
-from src.utils import (
-    convert_camel_to_title,
-    get_all_file_paths,
-    get_logger,
-    pipe_human_readable_date,
-)
+from src.template_catalog import catalog, custom_filters, render_each
+from src.utils import get_logger, pipe_human_readable_date
 
 router = APIRouter()
 
 log = get_logger(__name__)
 
-jinja_env = Environment(loader=FileSystemLoader("src/templates"))
-
-custom_filters = {}
-custom_filters["titleCase"] = convert_camel_to_title
-custom_filters["date"] = pipe_human_readable_date
-custom_filters["currency"] = lambda value: f"₹{value:,.2f}"
+# Cards rendered per /cards page, the page_size parameter is capped at the max
+CARDS_PAGE_SIZE = 100
+MAX_CARDS_PAGE_SIZE = 1000
 
+# Streamed html is sent once this many characters are buffered instead of one
+# write per template chunk, about a card, so the header goes out before the
+# transactions are read
+STREAM_CHUNK_SIZE = 1024
 
-catalog = Catalog()
-catalog.add_folder("src/templates")
-catalog.jinja_env.filters.update(custom_filters)
+jinja_env = Environment(loader=FileSystemLoader("src/templates"))
 jinja_env.filters.update(custom_filters)
+jinja_env.globals["render_each"] = render_each
+
+
+def buffer_chunks(chunks: Iterator[str], size: int = STREAM_CHUNK_SIZE):
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def cache_chunks(
+    chunks: Iterator[str],
+    key,
+    generation: int,
+    to_value: Callable[[str], Any] = lambda html: html,
+    **tags,
+):
+    """
+    Passes the chunks on and caches `to_value` of the whole html once the
+    last one is sent, a page whose client went away is not cached.
+    """
+    rendered = []
+    for chunk in chunks:
+        rendered.append(chunk)
+        yield chunk
+    response_cache.put(key, to_value("".join(rendered)), generation, **tags)
+
+
+def render_cards_footer(start_ns: int, count: int, next_cursor: Optional[str]) -> str:
+    # rendered for every response, a cached page gets the time it took now
+    return catalog.render(
+        "TransactionsFooter",
+        tail_tags=[
+            f"{count} Txns",
+            f"{round((time.time_ns() - start_ns)*1e-6, 3)}ms",
+        ],
+        next_cursor=next_cursor,
+    )
 
 
 @router.get("/table", response_class=HTMLResponse)
@@ -57,8 +99,8 @@ async def call_server(
     type: TransactionIndicator = Form(None),
 ):
     log.info(f"Received orderId: {id} notes: {notes} type: {type}")
-    txnSrv = TransactionService()
-    res = txnSrv.update_transaction(id, type, notes)
+    txnSrv = AsyncTransactionService()
+    res = await txnSrv.update_transaction(id, type, notes)
     log.debug(res)
     return {"orderId": id, "notes": notes, "type": type}
 
@@ -70,10 +112,20 @@ async def render_cards_template(
     indicator: Optional[TransactionIndicator] = None,
     phrase: Optional[Vendor.vendors_type] = None,
     Mapped: Optional[Literal["true", "false"]] = "false",
+    after: Optional[str] = None,
+    page_size: int = CARDS_PAGE_SIZE,
 ):
     st = time.time_ns()
+    page_size = max(1, min(page_size, MAX_CARDS_PAGE_SIZE))
+    cache_key = ("cards", month, indicator, phrase, Mapped, after, page_size)
+    cached_page = response_cache.get(cache_key)
+    if cached_page is not None:
+        html, count, next_cursor = cached_page
+        return HTMLResponse(html + render_cards_footer(st, count, next_cursor))
+    generation = response_cache.generation
+
     tags = []
-    txnSrv = TransactionService()
+    txnSrv = AsyncTransactionService()
     if month is not None:
         start_date, end_date = get_start_and_end_for_month(month)
     else:
@@ -95,17 +147,21 @@ async def render_cards_template(
 
     isChecked = True if Mapped == "true" else False
 
-    transactions_data = list(
-        txnSrv.get_all_transactions(
+    try:
+        # the transactions are read while the page streams, after the header
+        page = txnSrv.iter_transactions_page(
+            page_size,
+            after,
             view_cols,
+            sort_by=sort_by,
             start_date=start_date,
             end_date=end_date,
             indicator=indicator,
             phrase=phrase,
             combine_with_vendor_data=isChecked,
-            sort_by=sort_by,
         )
-    )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     months_list = get_months()
 
@@ -127,8 +183,6 @@ async def render_cards_template(
         for vendor in Vendor.vendor_list
     ]
 
-    tags.append(f"{len(transactions_data)} Txns")
-    tags.append(f"{round((time.time_ns() - st)*1e-6, 3)}ms")
     tags.append(f"Sorted: {sort_by}")
     tags.append(
         f"Indicator: {indicator.value}" if indicator is not None else "All Txns"
@@ -140,38 +194,78 @@ async def render_cards_template(
     if month is not None:
         selected_month = months_list[month - 1]
 
-    return catalog.render(
-        "TransactionsPage",
-        request=request,
-        heading="_id",
-        name="Transactions",
-        priceHeader=priceHeader,
-        indicatorHeader="TransactionIndicator",
-        tags=tags,
-        months=display_months,
-        selected_month=selected_month,
-        selected_vendor=phrase,
-        vendors=display_vendors,
-        data=transactions_data,
-        isMapped=isChecked,
+    def stream_cards() -> Iterator[str]:
+        yield catalog.render(
+            "TransactionsHeader",
+            name="Transactions",
+            tags=tags,
+            months=display_months,
+            selected_month=selected_month,
+            selected_vendor=phrase,
+            vendors=display_vendors,
+            isMapped=isChecked,
+        )
+        # the cards are rendered as the transactions are read
+        yield from jinja_env.get_template("transaction_cards.html").generate(
+            data=page,
+            heading="_id",
+            indicatorHeader="TransactionIndicator",
+            priceHeader=priceHeader,
+        )
+
+    def stream_page() -> Iterator[str]:
+        # the footer is not cached, it carries the time taken
+        yield from cache_chunks(
+            stream_cards(),
+            cache_key,
+            generation,
+            to_value=lambda html: (html, page.count, page.next_cursor),
+            month=get_cache_month(start_date),
+            indicator=indicator.value if indicator is not None else None,
+        )
+        yield render_cards_footer(st, page.count, page.next_cursor)
+
+    return StreamingResponse(
+        iterate_in_db_executor(buffer_chunks(stream_page())), media_type="text/html"
     )
 
 
 @router.get("/ingest-data", response_class=HTMLResponse)
 async def ingest_data(request: Request):
-    st = time.time_ns()
-    service = DataIngestionService()
-    res = service.ingest_data()
+    try:
+        job = ingestion_jobs.submit()
+        title = f"Ingestion job {job.id} started"
+    except IngestionJobConflict as e:
+        job = e.job
+        title = f"Ingestion job {job.id} is already running"
     return catalog.render(
         "good",
-        title=f"{res} Transactions Ingested in {round((time.time_ns() - st)*1e-9, 3)}secs",
-        task="Ingest Data Task",
+        title=title,
+        task=f"Ingest Data Task, progress at /jobs/{job.id}",
     )
 
 
+@router.get("/jobs/{job_id}")
+async def ingestion_job_status(job_id: str):
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict()
+
+
+@router.get("/metrics/db-pool")
+async def db_pool_metrics():
+    return mongo_connector.pool_metrics.to_dict()
+
+
+@router.get("/metrics/response-cache")
+async def response_cache_metrics():
+    return response_cache.to_dict()
+
+
 @router.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request, month: Optional[int] = None):
-    txnSrv = TransactionService()
+    txnSrv = AsyncTransactionService()
     vendor_metrics = {
         "Zomato": {
             "Total Transactions": 145,
@@ -195,11 +289,20 @@ async def dashboard(request: Request, month: Optional[int] = None):
     else:
         start_date = end_date = None
 
-    unread_transactions = get_all_unread_transaction_files()
-    last_transaction_date = txnSrv.get_last_transaction_date(start_date, end_date)
-    pending_transactions = txnSrv.get_pending_transactions(start_date, end_date)
-    split_transactions = txnSrv.get_split_transactions(start_date, end_date)
-    settled_transactions = txnSrv.get_settled_transactions(start_date, end_date)
+    # a folder marked for a rescan is walked here, off the event loop
+    unread_transactions = await run_in_threadpool(get_all_unread_transaction_files)
+    # the file list and the days since the last transaction are not cached,
+    # they change without a write
+    summary_key = ("dashboard", month)
+    summary = response_cache.get(summary_key)
+    if summary is None:
+        generation = response_cache.generation
+        summary = await txnSrv.get_dashboard_summary(start_date, end_date)
+        response_cache.put(
+            summary_key, summary, generation, month=get_cache_month(start_date)
+        )
+    last_transaction_date = summary["last_transaction_date"]
+    indicator_counts = summary["counts"]
 
     kpi_link_gen = partial(generate_next_link, "/cards", month=month, phrase=None)
 
@@ -228,19 +331,19 @@ async def dashboard(request: Request, month: Optional[int] = None):
         },
         {
             "name": "Number Of Pending Transactions",
-            "value": len(list(pending_transactions)),
+            "value": indicator_counts[TransactionIndicator.PENDING.value],
             "color": "yellow-500",
             "link": kpi_link_gen(TransactionIndicator.PENDING),
         },
         {
             "name": "Transactions Waiting to be Split",
-            "value": len(list(split_transactions)),
+            "value": indicator_counts[TransactionIndicator.NEEDS_SPLIT.value],
             "color": "red-500",
             "link": kpi_link_gen(TransactionIndicator.NEEDS_SPLIT),
         },
         {
             "name": "Total Settled Transactions",
-            "value": len(list(settled_transactions)),
+            "value": indicator_counts[TransactionIndicator.SETTLED.value],
             "color": "purple-500",
             "link": kpi_link_gen(TransactionIndicator.SETTLED),
         },
@@ -258,18 +361,13 @@ async def dashboard(request: Request, month: Optional[int] = None):
 
 
 def get_all_unread_transaction_files() -> list[str]:
-    zomato_files = get_all_file_paths("zomato_orders", ".json")
-    zepto_file = get_all_file_paths("zepto_orders", ".json")
-    eatSure_files = get_all_file_paths(Vendor.get_data_folder("eatSure"), ".json")
-
-    all_files = (
-        get_all_file_paths(r"bank_transactions\hdfc_data")
-        + get_all_file_paths(r"bank_transactions\icici_data")
-        + zomato_files
-        + zepto_file
-        + eatSure_files
-    )
-    return [file for file in all_files if "old" not in file]
+    return [
+        file_path
+        for source in INPUT_FOLDERS
+        for file_path in file_inventory.get_paths(
+            source, None if source in ("hdfc", "icici") else ".json"
+        )
+    ]
 
 
 def calculate_days_since_last_transaction(
@@ -1,41 +1,106 @@
 import os
-from datetime import timedelta, datetime
+from datetime import datetime
+from itertools import islice
 
 import pandas as pd
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from pymongo.results import InsertManyResult
 
 from src.bank_parser.hdfc_parser import HdfcExcelDataReader
 from src.bank_parser.icici_parser import IciciExcelDataReader
 from src.db import mongo
+from src.file_inventory import file_inventory
+from src.parse_cache import parse_cache
+from src.response_cache import response_cache
 from src.service.const import Category, TransactionIndicator
-from src.utils import get_all_file_paths, get_logger, read_json_files_from_folder
+from src.utils import get_logger, iter_json_files
 
-from src.service.vendor import Vendor
+from src.service.summary import SummaryService
+from src.service.vendor import Vendor, vendor_tags
+from src.service.vendor_matching import VendorMatchingService
 
-from typing import List
+from typing import List, Literal, Optional
 
 log = get_logger(__name__)
 
+# Rows parsed, enriched and inserted at once when streaming bank transactions
+INGEST_BATCH_SIZE = 5000
+
+# Code of the write errors of records whose _id is already stored
+DUPLICATE_KEY_ERROR = 11000
+
+# Vendor exports this large are streamed order by order instead of decoded whole
+VENDOR_STREAM_MIN_BYTES = 64 * 1024 * 1024
+
+# Vendors whose orders are linked to the transactions
+MATCHED_VENDORS: List[Vendor.vendors_type] = ["zomato", "zepto", "eatSure"]
+
+MatchMode = Literal["bulk", "aggregate", "tolerance", "query"]
+MATCH_MODES = ("bulk", "aggregate", "tolerance", "query")
+
+# Stages of `DataIngestionService.ingest_data`, in the order they run
+INGEST_STAGES = ("transactions", "vendors", "move_files", "vendor_mapping")
+
+
+class IngestionProgress:
+    """
+    Receives the progress of `DataIngestionService.ingest_data`, this one
+    ignores it. `add_rows` counts the rows written, or files moved for
+    `move_files`, by the current stage.
+    """
+
+    def start_stage(self, stage: str):
+        pass
+
+    def add_rows(self, rows: int):
+        pass
+
+    def finish_stage(self):
+        pass
+
 
 class DataIngestionService:
-    def __init__(self):
+    def __init__(self, parser_workers: Optional[int] = 1):
+        """
+        Args:
+            parser_workers (int, optional): Processes used to parse the bank
+                statements, `None` uses one per CPU. Defaults to 1, parsing in
+                the calling process.
+        """
         log.info("Initializing Data Reader and writer Objects")
 
-        self.hdfc_files = get_all_file_paths(r"bank_transactions\hdfc_data", ".xls")
-        self.icici_files = get_all_file_paths(r"bank_transactions\icici_data", ".xls")
-
-        self.zomato_files = get_all_file_paths(
-            Vendor.get_data_folder("zomato"), ".json"
+        # the inventory may be a poll interval behind, files just dropped in
+        # are ingested too
+        file_inventory.mark_dirty()
+        # statements already moved to .old are neither parsed nor hashed
+        hdfc_files = file_inventory.get_files("hdfc", ".xls")
+        icici_files = file_inventory.get_files("icici", ".xls")
+        self.hdfc_files = [file.path for file in hdfc_files]
+        self.icici_files = [file.path for file in icici_files]
+
+        self.zomato_files = file_inventory.get_paths("zomato", ".json")
+        self.zepto_files = file_inventory.get_paths("zepto", ".json")
+        self.eatSure_files = file_inventory.get_paths("eatSure", ".json")
+
+        # a statement downloaded twice is only parsed once, both are moved
+        hdfc_files = file_inventory.deduplicate(hdfc_files)
+        icici_files = file_inventory.deduplicate(icici_files)
+        # deduplicating hashed the statements, the parse cache reuses them
+        self.hdfc_parser = HdfcExcelDataReader(
+            [file.path for file in hdfc_files],
+            parser_workers,
+            {file.path: file_inventory.get_content_hash(file) for file in hdfc_files},
         )
-        self.zepto_files = get_all_file_paths(Vendor.get_data_folder("zepto"), ".json")
-        self.eatSure_files = get_all_file_paths(
-            Vendor.get_data_folder("eatSure"), ".json"
+        self.icici_parser = IciciExcelDataReader(
+            [file.path for file in icici_files],
+            parser_workers,
+            {file.path: file_inventory.get_content_hash(file) for file in icici_files},
         )
 
-        self.hdfc_parser = HdfcExcelDataReader(self.hdfc_files)
-        self.icici_parser = IciciExcelDataReader(self.icici_files)
-
         self.transactions = mongo["transactions"]
+        self.vendor_matcher = VendorMatchingService()
+        self.summary = SummaryService()
 
     def ingest_parsed_data(self, parser, bank_name, toCSV=False):
         # Check if parser is valid
@@ -61,37 +126,247 @@ class DataIngestionService:
             log.warn("No valid Bank file paths were provided.")
             return InsertManyResult(acknowledged=False, inserted_ids=[])
 
-        df["TransactionIndicator"] = TransactionIndicator.PENDING.value
-        df["Category"] = Category.UNKNOWN.value
+        df = self._add_transaction_defaults(df)
+
+        if debug:
+            self.transactions.drop()
+            self.summary.clear()
+
+        # Insert records into MongoDB collection
+        log.info("Inserting records into MongoDB...")
+        return self._insert_transactions(df)
+
+    def ingest_transactions_in_batches(
+        self,
+        batch_size: int = INGEST_BATCH_SIZE,
+        toCSV=False,
+        debug=True,
+        progress: Optional[IngestionProgress] = None,
+    ) -> InsertManyResult:
+        """
+        Streams the bank transactions into MongoDB. Parsers yield batches of at
+        most `batch_size` rows and every batch is enriched and inserted on its
+        own, so memory stays bounded by the batch size instead of the history.
+
+        Args:
+            batch_size (int, optional): Rows parsed, enriched and inserted at once.
+            toCSV (bool, optional): Also write the parsed rows to `<bank>_data.csv`.
+            debug (bool, optional): Drop the transactions collection first.
+            progress (IngestionProgress, optional): Told the rows inserted
+                by every batch.
+
+        Returns:
+            InsertManyResult: The ids inserted over all batches.
+        """
+        log.info(
+            f"Ingesting data from HDFC and ICICI Excel files in batches of {batch_size}..."
+        )
+        bank_parsers = [(self.hdfc_parser, "hdfc"), (self.icici_parser, "icici")]
+        if all(parser.invalid_init for parser, _ in bank_parsers):
+            log.warn("No valid Bank file paths were provided.")
+            return InsertManyResult(acknowledged=False, inserted_ids=[])
+
+        if debug:
+            self.transactions.drop()
+            self.summary.clear()
+
+        inserted_ids = []
+        for parser, bank_name in bank_parsers:
+            if parser.invalid_init:
+                log.warning(f"No valid {bank_name} file paths were provided.")
+                continue
+
+            for batch_number, bank_df in enumerate(parser.read_batches(batch_size)):
+                if toCSV:
+                    bank_df.to_csv(
+                        f"{bank_name}_data.csv",
+                        index=False,
+                        mode="a" if batch_number else "w",
+                        header=batch_number == 0,
+                    )
+                df = self._add_transaction_defaults(bank_df)
+                result = self._insert_transactions(df)
+                inserted_ids.extend(result.inserted_ids)
+                if progress:
+                    progress.add_rows(len(result.inserted_ids))
+                log.debug(
+                    f"Inserted batch {batch_number} of {bank_name}: {len(result.inserted_ids)} records"
+                )
+
+        return InsertManyResult(acknowledged=True, inserted_ids=inserted_ids)
+
+    def retag_transactions(
+        self, batch_size: int = INGEST_BATCH_SIZE, untagged_only: bool = False
+    ) -> int:
+        """
+        Tags the stored transactions with their vendor again, run it after
+        the vendor patterns change or to backfill transactions ingested before
+        the `vendor` field existed.
+
+        Args:
+            batch_size (int, optional): Transactions tagged and written at once.
+            untagged_only (bool, optional): Only the transactions without a
+                `vendor` field.
+
+        Returns:
+            int: The number of transactions whose vendor changed.
+        """
+        log.info("Tagging transactions with their vendor...")
+
+        query = {"vendor": {"$exists": False}} if untagged_only else {}
+        modified_count = 0
+        cursor = self.transactions.find(query, {"Narration": 1, "vendor": 1})
+        while True:
+            batch = list(islice(cursor, batch_size))
+            if not batch:
+                break
+
+            df = pd.DataFrame(batch)
+            # untagged transactions get the field even when no vendor matches
+            untagged = pd.Series(["vendor" not in txn for txn in batch], df.index)
+            if "vendor" not in df:
+                df["vendor"] = None
+            tags = Vendor.tag_narrations(df["Narration"])
+            changed = untagged | (
+                (tags != df["vendor"]) & (tags.notna() | df["vendor"].notna())
+            )
+
+            updates = [
+                UpdateOne({"_id": txn_id}, {"$set": {"vendor": vendor}})
+                for txn_id, vendor in zip(df.loc[changed, "_id"], tags[changed])
+            ]
+            if updates:
+                result = self.transactions.bulk_write(updates, ordered=False)
+                modified_count += result.modified_count
+
+        log.info(f"Vendor changed for {modified_count} transactions")
+        if modified_count:
+            # vendor is a key of the summary buckets
+            self.summary.rebuild()
+        return modified_count
+
+    def backfill_vendor_tags(self) -> int:
+        """
+        Tags the transactions stored before the `vendor` field existed, the
+        vendor filters match the narration until it is done.
+
+        Returns:
+            int: The number of transactions tagged.
+        """
+        if vendor_tags.is_backfilled():
+            return 0
+        modified_count = self.retag_transactions(untagged_only=True)
+        if vendor_tags.is_backfilled():
+            log.info("Every transaction is tagged with its vendor")
+        response_cache.clear()
+        return modified_count
+
+    def _add_transaction_defaults(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.assign(
+            TransactionIndicator=TransactionIndicator.PENDING.value,
+            Category=Category.UNKNOWN.value,
+            vendor=Vendor.tag_narrations(df["Narration"]),
+        )
 
         # All transactions with zero withdrawal amount are considered settled
         df.loc[df["WithdrawalAmt"] == 0, "TransactionIndicator"] = (
             TransactionIndicator.SETTLED.value
         )
+        return df
 
-        if debug:
-            self.transactions.drop()
+    def _insert_transactions(self, df: pd.DataFrame) -> InsertManyResult:
+        """
+        Inserts the transactions and adds the ones which were new to the
+        transaction summary.
+        """
+        result = self._insert_records(self.transactions, df)
+        # only the first of the rows sharing an _id got in
+        inserted = df[df["_id"].isin(result.inserted_ids)].drop_duplicates("_id")
+        self.summary.add_transactions(inserted)
+        return result
+
+    def _insert_records(self, collection, df: pd.DataFrame) -> InsertManyResult:
+        """
+        Inserts the records which are not stored yet.
 
+        Raises:
+            BulkWriteError: When a record fails for another reason than a
+                duplicate key.
+        """
         records = df.to_dict(orient="records")
+        if not records:
+            return InsertManyResult(acknowledged=True, inserted_ids=[])
 
-        # Insert records into MongoDB collection
-        log.info("Inserting records into MongoDB...")
-        result = InsertManyResult(acknowledged=True, inserted_ids=[])
         try:
-            result = self.transactions.insert_many(records, ordered=False)
-        except Exception as e:
-            log.warn(f"Error inserting records: {e}")
+            result = collection.insert_many(records, ordered=False)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            if e.details.get("writeConcernErrors") or any(
+                error.get("code") != DUPLICATE_KEY_ERROR for error in write_errors
+            ):
+                raise
+            # unordered inserts keep going past duplicates, report what got in
+            log.warn(f"Skipped {len(write_errors)} records already stored")
+            failed = {error["index"] for error in write_errors}
+            result = InsertManyResult(
+                acknowledged=True,
+                inserted_ids=[
+                    record["_id"]
+                    for idx, record in enumerate(records)
+                    if idx not in failed and "_id" in record
+                ],
+            )
 
         return result
 
-    def ingest_data(self, toCSV=False, debug=False) -> int:
-        transaction_result = self.ingest_transactions(toCSV, debug)
-        vendor_result = self.ingest_vendor_data(toCSV, debug)
+    def ingest_data(
+        self,
+        toCSV=False,
+        debug=False,
+        batch_size: Optional[int] = None,
+        progress: Optional[IngestionProgress] = None,
+    ) -> int:
+        """
+        Ingests the bank and vendor files, moves them to `.old` and maps the
+        transactions to the vendor orders.
 
-        moved_files = 0
-        if not debug:
-            moved_files = self.move_processed_files_to_old()
-        modified_documents = self.map_transactions_to_vendors()
+        Args:
+            batch_size (int, optional): Stream the bank transactions in batches
+                of this many rows, by default they are inserted all at once.
+            progress (IngestionProgress, optional): Told when each of the
+                `INGEST_STAGES` starts and finishes and the rows it wrote.
+        """
+        progress = progress or IngestionProgress()
+        try:
+            progress.start_stage("transactions")
+            if batch_size:
+                transaction_result = self.ingest_transactions_in_batches(
+                    batch_size, toCSV, debug, progress
+                )
+            else:
+                transaction_result = self.ingest_transactions(toCSV, debug)
+                progress.add_rows(len(transaction_result.inserted_ids))
+            progress.finish_stage()
+
+            progress.start_stage("vendors")
+            vendor_result = self.ingest_vendor_data(toCSV, debug)
+            progress.add_rows(vendor_result)
+            progress.finish_stage()
+
+            progress.start_stage("move_files")
+            moved_files = 0
+            if not debug:
+                moved_files = self.move_processed_files_to_old()
+            progress.add_rows(moved_files)
+            progress.finish_stage()
+
+            progress.start_stage("vendor_mapping")
+            modified_documents = self.map_transactions_to_vendors()
+            progress.add_rows(modified_documents)
+            progress.finish_stage()
+        finally:
+            # even a failed ingestion may have written some transactions
+            response_cache.clear()
 
         return (
             len(transaction_result.inserted_ids)
@@ -100,31 +375,42 @@ class DataIngestionService:
             + moved_files
         )
 
-    def map_transactions_to_vendors(self) -> int:
-        log.info("Mapping transactions to vendor data")
+    def map_transactions_to_vendors(self, mode: MatchMode = "bulk") -> int:
+        """
+        Links the transactions to the vendor orders they paid for.
+
+        Args:
+            mode (str, optional): How the orders are matched.
+                `bulk` matches in memory and writes the links in one batch.
+                `aggregate` joins inside MongoDB with one pipeline and writes
+                the unique matches in one batch. `tolerance` also accepts near
+                amounts and assigns the closest orders when several qualify.
+                `query` looks up and updates every transaction on its own.
+        """
+        log.info(f"Mapping transactions to vendor data ({mode})")
+        if mode not in MATCH_MODES:
+            raise ValueError(f"Unknown matching mode: {mode}")
+
         modified_count = 0
-        modified_count += self.find_vendor_matches_update_db(
-            "zomato",
-            {
-                "status": 6,
-            },
-        )
-        modified_count += self.find_vendor_matches_update_db(
-            "zepto",
-            {
-                "status": "DELIVERED",
-            },
-        )
-        modified_count += self.find_vendor_matches_update_db(
-            "eatSure",
-            {
-                "status": "delivered",
-            },
-        )
+        for vendor_phrase in MATCHED_VENDORS:
+            if mode == "bulk":
+                modified_count += self.vendor_matcher.match_vendor(vendor_phrase)
+            elif mode == "aggregate":
+                modified_count += self.vendor_matcher.match_vendor_in_database(
+                    vendor_phrase
+                )
+            elif mode == "tolerance":
+                modified_count += self.vendor_matcher.match_vendor_with_tolerance(
+                    vendor_phrase
+                )
+            else:
+                modified_count += self.find_vendor_matches_update_db(vendor_phrase)
         return modified_count
 
     def find_vendor_matches_update_db(
-        self, vendor_phrase: Vendor.vendors_type, additional_filters={}
+        self,
+        vendor_phrase: Vendor.vendors_type,
+        additional_filters: Optional[dict] = None,
     ) -> int:
         """
         This function finds matching transactions and updates the database accordingly.
@@ -132,7 +418,7 @@ class DataIngestionService:
         Args:
             vendor_phrase (str): The vendor phrase to match.
             vendor_collection (MongoDB Collection): The vendor collection to search in.
-            additional_filters (dict, optional): Additional filters for the search. Defaults to {}.
+            additional_filters (dict, optional): Additional filters for the search. Defaults to the vendor's match filters.
 
         Returns:
             int: The number of modified transactions.
@@ -141,31 +427,20 @@ class DataIngestionService:
         # Find transactions that match the vendor phrase
 
         field = Vendor.get_transaction_foreign_field(vendor_phrase)
-
         matching_transactions = self.transactions.find(
-            {
-                "Narration": {
-                    "$regex": Vendor.get_narration_regex(vendor_phrase),
-                    "$options": "i",
-                },
-                field: {"$exists": False},
-            }
+            self.vendor_matcher.get_pending_query(vendor_phrase)
         )
 
         result = 0
         for txn in matching_transactions:
-            value_date = txn.get("ValueDate")
-            next_date = value_date + timedelta(days=1)
-            prior_date = value_date - timedelta(days=1)
-            gtltdate = {"$gte": prior_date, "$lt": next_date}
-
             # Find matches in the vendor collection
             matches = Vendor.get_collection(vendor_phrase).find(
-                {
-                    "totalCost": txn.get("WithdrawalAmt"),
-                    "orderDate": gtltdate,
-                    **additional_filters,
-                }
+                Vendor.get_order_query(
+                    vendor_phrase,
+                    txn.get("WithdrawalAmt"),
+                    txn.get("ValueDate"),
+                    additional_filters,
+                )
             )
 
             matched_ids = []
@@ -191,27 +466,33 @@ class DataIngestionService:
     def insert_vendor(self, vendor_phrase) -> InsertManyResult:
         toCSV = False
 
-        self.parser = Vendor.get_parser(vendor_phrase)(
-            read_json_files_from_folder(Vendor.get_data_folder(vendor_phrase))
-        )
+        parser_class = Vendor.get_parser(vendor_phrase)
 
-        df = self.ingest_parsed_data(self.parser, vendor_phrase, toCSV)
+        files = file_inventory.deduplicate(
+            file_inventory.get_files(vendor_phrase, ".json")
+        )
+        file_paths = [file.path for file in files]
+
+        def parse_vendor_files():
+            if any(file.size >= VENDOR_STREAM_MIN_BYTES for file in files):
+                self.parser = parser_class(file_paths=file_paths)
+            else:
+                self.parser = parser_class(iter_json_files(file_paths))
+            return self.ingest_parsed_data(self.parser, vendor_phrase, toCSV)
+
+        df = parse_cache.get_or_parse(
+            parser_class.__name__,
+            parser_class.parser_version,
+            # hashed by the inventory while deduplicating
+            [file_inventory.get_content_hash(file) for file in files],
+            parse_vendor_files,
+        )
 
         if df.empty:
             log.warn(f"No valid {vendor_phrase} file paths were provided.")
             return InsertManyResult(acknowledged=True, inserted_ids=[])
 
-        records = df.to_dict(orient="records")
-
-        result = InsertManyResult(acknowledged=True, inserted_ids=[])
-        try:
-            result = Vendor.get_collection(vendor_phrase).insert_many(
-                records, ordered=False
-            )
-        except Exception as e:
-            log.warn(f"Error inserting records: {e}")
-
-        return result
+        return self._insert_records(Vendor.get_collection(vendor_phrase), df)
 
     def ingest_vendor_data(self, toCSV=False, debug=False) -> int:
         log.info("Ingesting data from Vendor JSON files...")
@@ -249,4 +530,5 @@ class DataIngestionService:
             current_date = datetime.now().strftime("%Y%m%d")
             new_file_name = f"{current_date}_{os.path.basename(file)}"
             os.rename(file, os.path.join(old_dir, new_file_name))
+        file_inventory.mark_dirty()
         return len(valid_files)
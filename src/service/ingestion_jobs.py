@@ -0,0 +1,211 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor
+from datetime import datetime
+from typing import Dict, Literal, Optional
+
+from src.db.executor import ingest_executor
+from src.file_inventory import INPUT_FOLDERS
+from src.service.data_ingestion import (
+    INGEST_BATCH_SIZE,
+    INGEST_STAGES,
+    DataIngestionService,
+    IngestionProgress,
+)
+from src.utils import get_logger
+
+log = get_logger(__name__)
+
+# Finished jobs kept for the status endpoint, the oldest are forgotten first
+MAX_FINISHED_JOBS = 50
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+StageStatus = Literal["pending", "running", "done", "failed"]
+
+
+class StageProgress:
+    def __init__(self, name: str):
+        self.name = name
+        self.status: StageStatus = "pending"
+        self.rows = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        seconds = None
+        if self.started is not None:
+            seconds = (self.finished or time.perf_counter()) - self.started
+        return {
+            "name": self.name,
+            "status": self.status,
+            "rows": self.rows,
+            "seconds": round(seconds, 3) if seconds is not None else None,
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else None,
+        }
+
+
+class IngestionJob(IngestionProgress):
+    """
+    One run of `DataIngestionService.ingest_data`, updated by the ingestion
+    thread and read by the status endpoint.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        # a job ingests every input folder
+        self.sources = tuple(INPUT_FOLDERS)
+        self.status: JobStatus = "queued"
+        self.submitted_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[int] = None
+        self.error: Optional[str] = None
+        self.stages = {stage: StageProgress(stage) for stage in INGEST_STAGES}
+        self._stage: Optional[StageProgress] = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def start(self):
+        with self._lock:
+            self.status = "running"
+            self.started_at = datetime.now()
+
+    def start_stage(self, stage: str):
+        with self._lock:
+            self._stage = self.stages[stage]
+            self._stage.status = "running"
+            self._stage.started = time.perf_counter()
+
+    def add_rows(self, rows: int):
+        with self._lock:
+            if self._stage:
+                self._stage.rows += rows
+
+    def finish_stage(self):
+        with self._lock:
+            if self._stage:
+                self._stage.status = "done"
+                self._stage.finished = time.perf_counter()
+                self._stage = None
+
+    def succeed(self, result: int):
+        with self._lock:
+            self.status = "succeeded"
+            self.result = result
+            self.finished_at = datetime.now()
+
+    def fail(self, error: Exception):
+        with self._lock:
+            if self._stage:
+                self._stage.status = "failed"
+                self._stage.finished = time.perf_counter()
+                self._stage = None
+            self.status = "failed"
+            self.error = str(error)
+            self.finished_at = datetime.now()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            seconds = None
+            if self.started_at:
+                seconds = (
+                    (self.finished_at or datetime.now()) - self.started_at
+                ).total_seconds()
+            rows = sum(stage.rows for stage in self.stages.values())
+            return {
+                "id": self.id,
+                "status": self.status,
+                "sources": list(self.sources),
+                "submitted_at": self.submitted_at.isoformat(),
+                "started_at": self.started_at and self.started_at.isoformat(),
+                "finished_at": self.finished_at and self.finished_at.isoformat(),
+                "seconds": round(seconds, 3) if seconds is not None else None,
+                "rows": rows,
+                "rows_per_second": round(rows / seconds, 1) if seconds else None,
+                "result": self.result,
+                "error": self.error,
+                "stages": [stage.to_dict() for stage in self.stages.values()],
+            }
+
+
+class IngestionJobConflict(RuntimeError):
+    def __init__(self, job: IngestionJob):
+        super().__init__(f"Ingestion job {job.id} is already running")
+        self.job = job
+
+
+class IngestionJobRunner:
+    """
+    Runs ingestion jobs on `ingest_executor` so the request submitting one
+    returns right away and the query threads stay free for the dashboard.
+    Only one job at a time may ingest a source, a job submitted while another
+    holds one of its sources is refused.
+    """
+
+    def __init__(
+        self,
+        executor: Executor = ingest_executor,
+        max_finished_jobs: int = MAX_FINISHED_JOBS,
+    ):
+        self.executor = executor
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        # the unfinished job holding each source
+        self._active: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, batch_size: int = INGEST_BATCH_SIZE) -> IngestionJob:
+        """
+        Queues an ingestion of every input folder.
+
+        Args:
+            batch_size (int, optional): Bank transactions inserted at once, the
+                progress is updated after every batch.
+
+        Raises:
+            IngestionJobConflict: When a job is already ingesting a source.
+        """
+        job = IngestionJob()
+        with self._lock:
+            for source in job.sources:
+                if source in self._active:
+                    raise IngestionJobConflict(self._active[source])
+            for source in job.sources:
+                self._active[source] = job
+            self.jobs[job.id] = job
+            self._forget_finished_jobs()
+
+        self.executor.submit(self._run, job, batch_size)
+        log.info(f"Queued ingestion job {job.id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def _run(self, job: IngestionJob, batch_size: int):
+        job.start()
+        try:
+            service = DataIngestionService()
+            job.succeed(service.ingest_data(batch_size=batch_size, progress=job))
+            log.info(f"Ingestion job {job.id} done: {job.result}")
+        except Exception as e:
+            log.exception(f"Ingestion job {job.id} failed")
+            job.fail(e)
+        finally:
+            with self._lock:
+                for source in job.sources:
+                    if self._active.get(source) is job:
+                        del self._active[source]
+
+    def _forget_finished_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+
+ingestion_jobs = IngestionJobRunner()
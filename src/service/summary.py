@@ -0,0 +1,265 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pandas as pd
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from src.db import mongo
+from src.utils import get_logger
+
+log = get_logger(__name__)
+
+# A summary document holds the totals of the transactions sharing these values
+SUMMARY_KEY_FIELDS = ["month", "Bank", "vendor", "TransactionIndicator", "Category"]
+
+# `_id` of the state document recording that the summary was built
+BUILT_MARKER_ID = "built"
+
+
+class SummaryService:
+    """
+    Keeps `transaction_summary` in step with `transactions`: the number of
+    transactions, the withdrawn and deposited amounts and the last value date
+    of every `SUMMARY_KEY_FIELDS` combination, `month` being the first day of
+    the value date's month.
+
+    Ingestion adds the inserted transactions and triaging moves a transaction
+    between indicator buckets, `rebuild` recomputes everything. The summary is
+    only read once a rebuild, or a clear of both collections, recorded it as
+    built, transactions stored before it existed are missing until then.
+    """
+
+    indexes = [
+        IndexModel([(field, ASCENDING) for field in SUMMARY_KEY_FIELDS], unique=True),
+    ]
+
+    def __init__(self):
+        self.db = mongo["transaction_summary"]
+        self.transactions = mongo["transactions"]
+        # holds the built marker, `$out` replaces the summary collection
+        self.state = mongo["transaction_summary_state"]
+
+    def add_transactions(self, df: pd.DataFrame) -> int:
+        """
+        Adds newly inserted transactions to their summary buckets.
+
+        Returns:
+            int: The number of buckets updated.
+        """
+        if df.empty:
+            return 0
+
+        totals = (
+            df.assign(
+                month=df["ValueDate"].dt.to_period("M").dt.to_timestamp(),
+                Bank=df["Bank"] if "Bank" in df else None,
+                vendor=df["vendor"] if "vendor" in df else None,
+            )
+            .groupby(SUMMARY_KEY_FIELDS, dropna=False)
+            .agg(
+                count=("ValueDate", "size"),
+                WithdrawalAmt=("WithdrawalAmt", "sum"),
+                DepositAmt=("DepositAmt", "sum"),
+                LastValueDate=("ValueDate", "max"),
+            )
+            .reset_index()
+        )
+        # missing keys are stored as null, like the transactions without vendor
+        totals = totals.astype(object).where(totals.notna(), None)
+
+        updates = [
+            UpdateOne(
+                {field: bucket[field] for field in SUMMARY_KEY_FIELDS},
+                {
+                    "$inc": {
+                        "count": bucket["count"],
+                        "WithdrawalAmt": bucket["WithdrawalAmt"],
+                        "DepositAmt": bucket["DepositAmt"],
+                    },
+                    "$max": {"LastValueDate": bucket["LastValueDate"]},
+                },
+                upsert=True,
+            )
+            for bucket in totals.to_dict(orient="records")
+        ]
+        self.db.bulk_write(updates, ordered=False)
+        return len(updates)
+
+    def move_transaction(self, transaction: dict, new_indicator: str):
+        """
+        Moves a transaction from the bucket of its current indicator to the
+        bucket of `new_indicator`. The last value date of the bucket it leaves
+        is kept, it stays an upper bound until the next rebuild.
+        """
+        previous_indicator = transaction.get("TransactionIndicator")
+        if previous_indicator == new_indicator or not transaction.get("ValueDate"):
+            return
+
+        value_date: datetime = transaction["ValueDate"]
+        key = {
+            "month": datetime(value_date.year, value_date.month, 1),
+            "Bank": transaction.get("Bank"),
+            "vendor": transaction.get("vendor"),
+            "Category": transaction.get("Category"),
+        }
+        withdrawal = transaction.get("WithdrawalAmt") or 0
+        deposit = transaction.get("DepositAmt") or 0
+
+        self.db.bulk_write(
+            [
+                UpdateOne(
+                    {**key, "TransactionIndicator": previous_indicator},
+                    {
+                        "$inc": {
+                            "count": -1,
+                            "WithdrawalAmt": -withdrawal,
+                            "DepositAmt": -deposit,
+                        }
+                    },
+                ),
+                UpdateOne(
+                    {**key, "TransactionIndicator": new_indicator},
+                    {
+                        "$inc": {
+                            "count": 1,
+                            "WithdrawalAmt": withdrawal,
+                            "DepositAmt": deposit,
+                        },
+                        "$max": {"LastValueDate": value_date},
+                    },
+                    upsert=True,
+                ),
+            ],
+            ordered=True,
+        )
+
+    def rebuild(self):
+        """
+        Recomputes the summary from all transactions, replacing the stored one.
+        """
+        log.info("Rebuilding the transaction summary...")
+        self.transactions.aggregate(
+            [
+                {
+                    "$group": {
+                        "_id": {
+                            "month": {
+                                "$dateFromParts": {
+                                    "year": {"$year": "$ValueDate"},
+                                    "month": {"$month": "$ValueDate"},
+                                }
+                            },
+                            **{
+                                field: {"$ifNull": [f"${field}", None]}
+                                for field in SUMMARY_KEY_FIELDS[1:]
+                            },
+                        },
+                        "count": {"$sum": 1},
+                        "WithdrawalAmt": {"$sum": "$WithdrawalAmt"},
+                        "DepositAmt": {"$sum": "$DepositAmt"},
+                        "LastValueDate": {"$max": "$ValueDate"},
+                    }
+                },
+                {
+                    "$replaceWith": {
+                        "$mergeObjects": [
+                            "$_id",
+                            {
+                                "count": "$count",
+                                "WithdrawalAmt": "$WithdrawalAmt",
+                                "DepositAmt": "$DepositAmt",
+                                "LastValueDate": "$LastValueDate",
+                            },
+                        ]
+                    }
+                },
+                # replaces the collection in one step and keeps its indexes
+                {"$out": self.db.name},
+            ]
+        )
+        self._mark_built()
+
+    def ensure_built(self) -> bool:
+        """
+        Rebuilds the summary when it was never built from the transactions.
+
+        Returns:
+            bool: Whether it was rebuilt.
+        """
+        if self.is_built():
+            return False
+        self.rebuild()
+        return True
+
+    def is_built(self) -> bool:
+        return self.state.find_one({"_id": BUILT_MARKER_ID}, {"_id": 1}) is not None
+
+    def clear(self):
+        """
+        Empties the summary, call it when the transactions are dropped too.
+        """
+        self.db.delete_many({})
+        self._mark_built()
+
+    def _mark_built(self):
+        self.state.update_one(
+            {"_id": BUILT_MARKER_ID},
+            {"$set": {"built_at": datetime.now()}},
+            upsert=True,
+        )
+
+    def get_indicator_groups(
+        self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None
+    ) -> Optional[list[dict]]:
+        """
+        `count` and `last_transaction_date` per indicator (`_id`) read from the
+        monthly buckets, `None` when the summary was not built yet or the range
+        does not cover whole months so the transactions have to be read instead.
+        """
+        if not _starts_month(start_date) or not _ends_month(end_date):
+            return None
+        if not self.is_built():
+            return None
+
+        query = {}
+        if start_date or end_date:
+            query["month"] = {}
+        if start_date:
+            query["month"]["$gte"] = start_date
+        if end_date:
+            query["month"]["$lte"] = datetime(end_date.year, end_date.month, 1)
+
+        return list(
+            self.db.aggregate(
+                [
+                    {"$match": query},
+                    {
+                        "$group": {
+                            "_id": "$TransactionIndicator",
+                            "count": {"$sum": "$count"},
+                            "last_transaction_date": {
+                                "$max": {
+                                    "$cond": [
+                                        {"$gt": ["$count", 0]},
+                                        "$LastValueDate",
+                                        None,
+                                    ]
+                                }
+                            },
+                        }
+                    },
+                ]
+            )
+        )
+
+
+def _starts_month(date: Optional[datetime]) -> bool:
+    return date is None or date == datetime(date.year, date.month, 1)
+
+
+def _ends_month(date: Optional[datetime]) -> bool:
+    # value dates carry no time, a range ending on the last day covers it
+    return date is None or (
+        date == datetime(date.year, date.month, date.day)
+        and (date + timedelta(days=1)).day == 1
+    )
@@ -1,24 +1,143 @@
+import base64
+
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
 from src.db import mongo
-from datetime import datetime
-from typing import Optional
+from src.db.executor import run_in_db_executor
+from src.response_cache import response_cache
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, Iterator, Optional
 from src.service.const import TransactionIndicator
-from src.service.vendor import Vendor
+from src.service.summary import SummaryService
+from src.service.vendor import Vendor, vendor_tags
+
+
+# Keyset position of a page: the sort value and _id of its last transaction
+PageCursor = tuple[Any, Any]
+
+
+def encode_page_cursor(position: PageCursor) -> str:
+    # extended json keeps dates and other BSON types intact
+    payload = json_util.dumps({"value": position[0], "id": position[1]})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_page_cursor(cursor: str) -> PageCursor:
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return payload["value"], payload["id"]
+    except Exception as e:
+        raise ValueError(f"Invalid page cursor: {cursor}") from e
+
+
+class TransactionPage:
+    """
+    The transactions of one keyset page, fetched lazily: `query` runs on the
+    first iteration and the transactions are yielded as the cursor returns
+    them. `count` and `next_cursor` are known once the page is exhausted.
+    """
+
+    def __init__(
+        self,
+        query: Callable[[], Iterable[dict]],
+        page_size: int,
+        sort_by: str,
+        hidden_sort_field: bool = False,
+    ):
+        """
+        Args:
+            query (Callable): Returns the cursor, sorted on `sort_by` and
+                `_id`, limited to one transaction more than `page_size`.
+            page_size (int): Transactions per page.
+            sort_by (str): Field the pages are ordered by.
+            hidden_sort_field (bool, optional): Drop `sort_by` from the
+                transactions after reading the cursor position.
+        """
+        self.query = query
+        self.page_size = page_size
+        self.sort_by = sort_by
+        self.hidden_sort_field = hidden_sort_field
+        self.count = 0
+        self.next_cursor: Optional[str] = None
+
+    def __iter__(self) -> Iterator[dict]:
+        last = None
+        for transaction in self.query():
+            if self.count == self.page_size:
+                # the extra transaction, the page ends at the one before it
+                self.next_cursor = encode_page_cursor(last)
+                break
+            last = (transaction.get(self.sort_by), transaction["_id"])
+            self.count += 1
+            if self.hidden_sort_field:
+                transaction.pop(self.sort_by, None)
+            yield transaction
 
 
 class TransactionService:
+    # Indexes behind the queries built below, created by src.db.indexes
+    indexes = [
+        IndexModel([("TransactionIndicator", ASCENDING), ("ValueDate", DESCENDING)]),
+        IndexModel([("ValueDate", DESCENDING)]),
+        IndexModel([("vendor", ASCENDING), ("ValueDate", DESCENDING)]),
+        # keyset pages of the cards are sorted on TransactionDate and _id
+        IndexModel([("TransactionDate", DESCENDING), ("_id", DESCENDING)]),
+        # only the transactions linked to an order carry its foreign key
+        *[
+            IndexModel(
+                [(Vendor.get_transaction_foreign_field(phrase), ASCENDING)], sparse=True
+            )
+            for phrase in Vendor.vendor_list
+        ],
+    ]
+
     def __init__(self):
         self.db = mongo["transactions"]
+        self.summary = SummaryService()
 
-    def get_last_transaction_date(
+    def get_dashboard_summary(
         self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None
-    ) -> datetime:
-        query = {}
-        query = self._add_query_range(query, start_date, end_date)
+    ) -> dict:
+        """
+        Number of transactions per indicator and the last transaction date, in
+        one aggregation which only sends a document per indicator back. Ranges
+        of whole months are answered from the transaction summary.
+
+        Returns:
+            dict: `last_transaction_date` and the `counts` by indicator value,
+            indicators without transactions count 0.
+        """
+        # whole months are read from the summary, other ranges from transactions
+        groups = self.summary.get_indicator_groups(start_date, end_date)
+        if groups is None:
+            query = self._add_query_range({}, start_date, end_date)
+            groups = self.db.aggregate(
+                [
+                    {"$match": query},
+                    {
+                        "$group": {
+                            "_id": "$TransactionIndicator",
+                            "count": {"$sum": 1},
+                            "last_transaction_date": {"$max": "$ValueDate"},
+                        }
+                    },
+                ]
+            )
+
+        counts = {indicator.value: 0 for indicator in TransactionIndicator}
+        last_transaction_date = None
+        for group in groups:
+            counts[group["_id"]] = group["count"]
+            if last_transaction_date is None or (
+                group["last_transaction_date"] is not None
+                and group["last_transaction_date"] > last_transaction_date
+            ):
+                last_transaction_date = group["last_transaction_date"]
 
-        last_transaction = self.db.find_one(query, sort=[("ValueDate", -1)])
-        if last_transaction:
-            return last_transaction["ValueDate"]
-        raise Exception("No transactions found in the database")
+        if last_transaction_date is None:
+            raise Exception("No transactions found in the database")
+        return {"last_transaction_date": last_transaction_date, "counts": counts}
 
     def get_all_transactions(
         self,
@@ -29,21 +148,29 @@ class TransactionService:
         phrase: Optional[Vendor.vendors_type] = None,
         combine_with_vendor_data: bool = False,
         sort_by: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[PageCursor] = None,
     ):
+        """
+        Args:
+            limit (int, optional): Return at most this many transactions.
+            after (tuple, optional): Keyset position `(sort value, _id)`, only
+                transactions sorted after it are returned.
+        """
         # Jump to different flow to show mapped data
         if combine_with_vendor_data and phrase:
             return self.get_all_vendor_transactions(
-                phrase, cols, start_date, end_date, indicator, sort_by
+                phrase, cols, start_date, end_date, indicator, sort_by, limit, after
             )
-        query: dict = {}
-        query = self._add_query_range(query, start_date, end_date)
-        if indicator:
-            query = self._add_indicator_to_query(query, indicator)
-        if phrase:
-            query = self._add_phrase_to_query(query, phrase)
+        query = self._get_transactions_query(
+            start_date, end_date, indicator, phrase, sort_by, after
+        )
         transactions = self.db.find(query, cols) if cols else self.db.find(query)
         if sort_by:
-            return transactions.sort(sort_by, -1)
+            # _id breaks ties so pages never skip or repeat transactions
+            transactions = transactions.sort([(sort_by, -1), ("_id", -1)])
+        if limit:
+            transactions = transactions.limit(limit)
         return transactions
 
     def get_all_vendor_transactions(
@@ -54,52 +181,140 @@ class TransactionService:
         end_date: Optional[datetime] = None,
         indicator: Optional[TransactionIndicator] = None,
         sort_by: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[PageCursor] = None,
     ):
         local_field = Vendor.get_transaction_foreign_field(phrase)
         collection = Vendor.get_collection(phrase)
 
+        # sorted before the projection, which may drop the sort field
+        pipeline = [
+            {
+                "$match": self._get_vendor_transactions_query(
+                    phrase, start_date, end_date, indicator, sort_by, after
+                )
+            },
+            {"$sort": {sort_by: 1, "_id": 1}},
+            {
+                "$lookup": {
+                    "from": collection.name,
+                    "localField": local_field,
+                    "foreignField": "_id",
+                    "as": "special",
+                }
+            },
+            {"$unwind": {"path": "$special"}},
+        ]
+        if limit:
+            pipeline.append({"$limit": limit})
+        if cols:
+            pipeline.append({"$project": cols})
+        return self.db.aggregate(pipeline)
+
+    def _get_transactions_query(
+        self,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        indicator: Optional[TransactionIndicator],
+        phrase: Optional[Vendor.vendors_type],
+        sort_by: Optional[str],
+        after: Optional[PageCursor],
+    ) -> dict:
+        query: dict = {}
+        query = self._add_query_range(query, start_date, end_date)
+        if indicator:
+            query = self._add_indicator_to_query(query, indicator)
+        if phrase:
+            query = self._add_phrase_to_query(query, phrase)
+        if after:
+            query = self._add_page_cursor_to_query(query, sort_by, -1, after)
+        return query
+
+    def _get_vendor_transactions_query(
+        self,
+        phrase: Vendor.vendors_type,
+        start_date: Optional[datetime],
+        end_date: Optional[datetime],
+        indicator: Optional[TransactionIndicator],
+        sort_by: Optional[str],
+        after: Optional[PageCursor],
+    ) -> dict:
+        local_field = Vendor.get_transaction_foreign_field(phrase)
         match_query_args = [{local_field: {"$exists": True}}]
         match_query_args.append(self._add_query_range({}, start_date, end_date))
         if indicator:
             match_query_args.append(self._add_indicator_to_query({}, indicator))
-        return self.db.aggregate(
-            [
-                {"$match": {"$and": match_query_args}},
-                {
-                    "$lookup": {
-                        "from": collection.name,
-                        "localField": local_field,
-                        "foreignField": "_id",
-                        "as": "special",
-                    }
-                },
-                {"$unwind": {"path": "$special"}},
-                {"$project": cols},
-                {"$sort": {sort_by: 1}},
-            ]
-        )
+        if after:
+            match_query_args.append(
+                self._add_page_cursor_to_query({}, sort_by, 1, after)
+            )
+        return {"$and": match_query_args}
 
-    def get_pending_transactions(
-        self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None
-    ):
-        return self._get_transactions_by_indicator(
-            TransactionIndicator.PENDING, start_date, end_date
-        )
+    def iter_transactions_page(
+        self,
+        page_size: int,
+        after: Optional[str] = None,
+        cols: Optional[dict] = None,
+        sort_by: str = "TransactionDate",
+        **filters,
+    ) -> "TransactionPage":
+        """
+        One page of `get_all_transactions`, found by seeking to the keyset
+        cursor instead of skipping, so every page costs the same. The page is
+        read from the cursor as it is iterated so the first transactions can
+        be used before the last ones arrive, nothing is queried until then.
 
-    def get_split_transactions(
-        self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None
-    ):
-        return self._get_transactions_by_indicator(
-            TransactionIndicator.NEEDS_SPLIT, start_date, end_date
-        )
+        Args:
+            page_size (int): Transactions per page.
+            after (str, optional): Cursor of the previous page, `None` for the
+                first page.
+            cols (dict, optional): Projection, the sort field is read even
+                when it is projected out.
+            sort_by (str, optional): Field the pages are ordered by.
+            filters: The other arguments of `get_all_transactions`.
 
-    def get_settled_transactions(
-        self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None
-    ):
-        return self._get_transactions_by_indicator(
-            TransactionIndicator.SETTLED, start_date, end_date
+        Returns:
+            TransactionPage: The transactions, its `next_cursor` is `None` on
+            the last page.
+
+        Raises:
+            ValueError: When `after` is not a valid cursor.
+        """
+        position = decode_page_cursor(after) if after else None
+
+        hidden_sort_field = bool(cols) and cols.get(sort_by) == 0
+        if hidden_sort_field:
+            cols = {f: v for f, v in cols.items() if f != sort_by} or None
+
+        return TransactionPage(
+            lambda: self.get_all_transactions(
+                cols,
+                sort_by=sort_by,
+                # one extra transaction tells whether there is a next page
+                limit=page_size + 1,
+                after=position,
+                **filters,
+            ),
+            page_size,
+            sort_by,
+            hidden_sort_field,
         )
 
+    def _add_page_cursor_to_query(
+        self, query: dict, sort_by: Optional[str], direction: int, after: PageCursor
+    ) -> dict:
+        sort_value, last_id = after
+        operator = "$lt" if direction < 0 else "$gt"
+        if not sort_by:
+            query["_id"] = {operator: last_id}
+            return query
+
+        query["$or"] = [
+            {sort_by: {operator: sort_value}},
+            {sort_by: sort_value, "_id": {operator: last_id}},
+        ]
+        return query
+
     def _add_query_range(
         self, query, start_date: Optional[datetime], end_date: Optional[datetime]
     ) -> dict:
@@ -111,17 +326,6 @@ class TransactionService:
             query["ValueDate"] = {"$lte": end_date}
         return query
 
-    def _get_transactions_by_indicator(
-        self,
-        indicator: TransactionIndicator,
-        start_date: Optional[datetime] = None,
-        end_date: Optional[datetime] = None,
-    ):
-        query = {}
-        query: dict = self._add_query_range({}, start_date, end_date)
-        query = self._add_indicator_to_query(query, indicator)
-        return self.db.find(query, {"_id": 0})
-
     def _add_indicator_to_query(self, query: dict, indicator: TransactionIndicator):
         query["TransactionIndicator"] = indicator.value
         return query
@@ -149,13 +353,23 @@ class TransactionService:
             update_data["Notes"] = notes
         update_data["TransactionIndicator"] = new_indicator.value
 
-        # Get the previous indicator value (if available)
-        previous_indicator = self.db.find_one(
-            {"_id": transaction_id}, projection={"TransactionIndicator": 1}
+        # Get the previous indicator value (if available), with the fields
+        # locating the transaction's summary bucket
+        previous_transaction = self.db.find_one(
+            {"_id": transaction_id},
+            projection={
+                "TransactionIndicator": 1,
+                "ValueDate": 1,
+                "Bank": 1,
+                "vendor": 1,
+                "Category": 1,
+                "WithdrawalAmt": 1,
+                "DepositAmt": 1,
+            },
         )
         previous_indicator = (
-            previous_indicator.get("TransactionIndicator")
-            if previous_indicator
+            previous_transaction.get("TransactionIndicator")
+            if previous_transaction
             else None
         )
 
@@ -175,13 +389,66 @@ class TransactionService:
             },
         )
 
+        if previous_transaction and update_result.modified_count:
+            self.summary.move_transaction(previous_transaction, new_indicator.value)
+            # the cached pages listing it under either indicator are stale
+            value_date = previous_transaction.get("ValueDate")
+            response_cache.invalidate(value_date, previous_indicator)
+            response_cache.invalidate(value_date, new_indicator.value)
+
         return update_result
 
     def _add_phrase_to_query(self, query: dict, phrase: Vendor.vendors_type):
-        regex_phrase = Vendor.get_narration_regex(phrase)
-        query["Narration"] = {"$regex": regex_phrase, "$options": "i"}
+        # vendor is tagged from the narration at ingest, see Vendor.tag_narrations
+        query.update(vendor_tags.get_transaction_filter(phrase))
         return query
 
+    def get_query_shapes(self) -> list[tuple[str, dict, Optional[list]]]:
+        """
+        `(name, filter, sort)` of every query this service sends, built by the
+        same helpers as the queries with sample values, so their plans can be
+        checked with `explain`.
+        """
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=30)
+        date_range = self._add_query_range({}, start_date, end_date)
+        phrase = Vendor.vendor_list[0]
+        sort_by = "TransactionDate"
+        position = (end_date, "")
+
+        query_shapes = [("dashboard summary", date_range, None)]
+        # every filter combination of the keyset pages
+        for dates, (start, end) in [
+            ("", (None, None)),
+            (" of month", (start_date, end_date)),
+        ]:
+            for indicator in (None, TransactionIndicator.PENDING):
+                for after in (None, position):
+                    suffix = dates + (" by indicator" if indicator else "")
+                    suffix += " after cursor" if after else ""
+                    for vendor in (None, phrase):
+                        query_shapes.append(
+                            (
+                                "transactions page"
+                                + suffix
+                                + (" by vendor" if vendor else ""),
+                                self._get_transactions_query(
+                                    start, end, indicator, vendor, sort_by, after
+                                ),
+                                [(sort_by, -1), ("_id", -1)],
+                            )
+                        )
+                    query_shapes.append(
+                        (
+                            "transactions linked to vendor" + suffix,
+                            self._get_vendor_transactions_query(
+                                phrase, start, end, indicator, sort_by, after
+                            ),
+                            [(sort_by, 1), ("_id", 1)],
+                        )
+                    )
+        return query_shapes
+
     @staticmethod
     def generate_tailwind_colors():
         colors = {
@@ -192,3 +459,38 @@ class TransactionService:
         }
 
         return colors
+
+
+class AsyncTransactionService:
+    """
+    Async variants of the `TransactionService` methods for the routes. The
+    blocking pymongo calls run on the bounded `db_executor` pool and cursors
+    are read there too, so the event loop keeps serving other requests.
+    """
+
+    def __init__(self, transaction_service: Optional[TransactionService] = None):
+        self.service = transaction_service or TransactionService()
+
+    async def get_dashboard_summary(
+        self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None
+    ) -> dict:
+        return await run_in_db_executor(
+            self.service.get_dashboard_summary, start_date, end_date
+        )
+
+    def iter_transactions_page(self, *args, **kwargs) -> TransactionPage:
+        """
+        Same arguments as `TransactionService.iter_transactions_page`. Nothing
+        is queried here, iterate the page with `iterate_in_db_executor`.
+        """
+        return self.service.iter_transactions_page(*args, **kwargs)
+
+    async def update_transaction(
+        self,
+        transaction_id: str,
+        new_indicator: TransactionIndicator,
+        notes: str,
+    ):
+        return await run_in_db_executor(
+            self.service.update_transaction, transaction_id, new_indicator, notes
+        )
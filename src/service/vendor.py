@@ -1,10 +1,15 @@
-from typing import Literal, List, Dict
+import re
+from datetime import datetime, timedelta
+from typing import Literal, List, Dict, Optional
+
+import pandas as pd
+
 from src.db import mongo
 from src.vendors.zepto.order_parser import ZeptoOrderParser as ZeptoOrderParser
 from src.vendors.zomato.order_parser import OrderParser as ZomatoOrderParser
 from src.vendors.eat_sure import EatSureOrderParser
 
-from pymongo import collection
+from pymongo import ASCENDING, IndexModel, collection
 
 
 class Vendor:
@@ -32,6 +37,7 @@ class Vendor:
             "collection": "zomato",
             "folder": "zomato_orders",
             "parser": ZomatoOrderParser,
+            "filters": {"status": 6},
         },
         "zepto": {
             "regex": ["zepto", "66490784@", "geddit"],
@@ -39,6 +45,7 @@ class Vendor:
             "collection": "zepto",
             "folder": "zepto_orders",
             "parser": ZeptoOrderParser,
+            "filters": {"status": "DELIVERED"},
         },
         "blinkit": {
             "regex": ["blin", "grofer"],
@@ -46,6 +53,7 @@ class Vendor:
             "collection": "blinkit",
             "folder": "blinkit_orders",
             "parser": lambda x: x,
+            "filters": {},
         },
         "eatSure": {
             "regex": ["rebel", "59724445"],
@@ -53,6 +61,7 @@ class Vendor:
             "collection": "eatSure",
             "folder": "eat_sure_orders",
             "parser": EatSureOrderParser,
+            "filters": {"status": "delivered"},
         },
         "starbucks": {
             "regex": ["starb"],
@@ -60,6 +69,7 @@ class Vendor:
             "collection": "starbucks",
             "folder": "",
             "parser": None,
+            "filters": {},
         },
         "compass": {
             "regex": ["compas", "33345433"],
@@ -67,6 +77,7 @@ class Vendor:
             "collection": "compass",
             "folder": "",
             "parser": None,
+            "filters": {},
         },
         "swiggy": {
             "regex": ["swiggy"],
@@ -74,6 +85,7 @@ class Vendor:
             "collection": "swiggy",
             "folder": "",
             "parser": None,
+            "filters": {},
         },
     }
 
@@ -86,6 +98,87 @@ class Vendor:
             regex_phrase = regex_strings[0]
         return regex_phrase
 
+    # Indexes behind the order lookups of the vendor matching
+    order_indexes = [
+        IndexModel(
+            [("totalCost", ASCENDING), ("status", ASCENDING), ("orderDate", ASCENDING)]
+        ),
+    ]
+
+    @classmethod
+    def get_index_declarations(cls) -> Dict[str, List[IndexModel]]:
+        """
+        Indexes of the vendor collections which have orders, by collection name.
+        """
+        return {
+            cls.vendor_data[phrase]["collection"]: cls.order_indexes
+            for phrase in cls.vendor_list
+            if cls.get_parser(phrase) is not None
+        }
+
+    @classmethod
+    def get_order_query(
+        cls,
+        phrase: vendors_type,
+        amount: float,
+        value_date: datetime,
+        filters: Optional[dict] = None,
+    ) -> dict:
+        """
+        Orders of `amount` placed within a day of `value_date` which meet
+        `filters`, by default the match filters of the vendor.
+        """
+        if filters is None:
+            filters = cls.get_match_filters(phrase)
+        return {
+            "totalCost": amount,
+            "orderDate": {
+                "$gte": value_date - timedelta(days=1),
+                "$lt": value_date + timedelta(days=1),
+            },
+            **filters,
+        }
+
+    @classmethod
+    def get_query_shapes(cls, phrase: vendors_type) -> list[tuple[str, dict, None]]:
+        """
+        `(name, filter, sort)` of the order lookups of a vendor with sample
+        values, so their plans can be checked with `explain`.
+        """
+        return [
+            (
+                f"{phrase} orders by amount",
+                cls.get_order_query(phrase, 100.0, datetime.now()),
+                None,
+            ),
+        ]
+
+    @classmethod
+    def get_vendor_pattern(cls) -> re.Pattern:
+        """
+        One case insensitive pattern for the narrations of all vendors, with a
+        named group per vendor in `vendor_list` order.
+        """
+        return re.compile(
+            "|".join(
+                f"(?P<{phrase}>{cls.get_narration_regex(phrase)})"
+                for phrase in cls.vendor_list
+            ),
+            re.IGNORECASE,
+        )
+
+    @classmethod
+    def tag_narrations(cls, narrations: pd.Series) -> pd.Series:
+        """
+        The vendor of every narration, `None` when no vendor pattern matches.
+        Narrations are scanned once for all vendors, the earliest match in the
+        narration wins and ties go to the vendor listed first.
+        """
+        matches = narrations.astype(str).str.extract(cls.get_vendor_pattern())
+        matched = matches.notna()
+        vendors = matched.idxmax(axis=1).astype(object)
+        return vendors.where(matched.any(axis=1), None)
+
     @classmethod
     def get_transaction_foreign_field(cls, phrase: vendors_type) -> str:
         return cls.vendor_data[phrase]["field"]
@@ -101,3 +194,48 @@ class Vendor:
     @classmethod
     def get_parser(cls, phrase: vendors_type):
         return cls.vendor_data[phrase]["parser"]
+
+    @classmethod
+    def get_match_filters(cls, phrase: vendors_type) -> dict:
+        """
+        Conditions a vendor order has to meet to be linked to a transaction.
+        """
+        return cls.vendor_data[phrase]["filters"]
+
+
+class VendorTags:
+    """
+    Whether every stored transaction has the `vendor` tag set at ingest.
+    Transactions stored before the tag existed are found by their narration
+    until `DataIngestionService.backfill_vendor_tags` tagged them.
+    """
+
+    def __init__(self):
+        self.backfilled = False
+
+    def is_backfilled(self) -> bool:
+        if not self.backfilled:
+            # new transactions are tagged at ingest, once true it stays true
+            self.backfilled = (
+                mongo["transactions"].find_one(
+                    {"vendor": {"$exists": False}}, {"_id": 1}
+                )
+                is None
+            )
+        return self.backfilled
+
+    def get_transaction_filter(self, phrase: Vendor.vendors_type) -> dict:
+        """
+        Condition on the transactions of a vendor.
+        """
+        if self.is_backfilled():
+            return {"vendor": phrase}
+        return {
+            "Narration": {
+                "$regex": Vendor.get_narration_regex(phrase),
+                "$options": "i",
+            }
+        }
+
+
+vendor_tags = VendorTags()
@@ -0,0 +1,372 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from src.db import mongo
+from src.service.vendor import Vendor, vendor_tags
+from src.utils import get_logger
+
+log = get_logger(__name__)
+
+# A transaction is matched to orders placed up to a day before or after it
+MATCH_WINDOW = timedelta(days=1)
+
+# Largest difference between a withdrawal and an order total in tolerance mode
+AMOUNT_TOLERANCE = 1.0
+
+OrderKey = Tuple[float, date]
+
+
+class VendorMatchingService:
+    """
+    Links bank transactions to vendor orders of the same amount placed within
+    `MATCH_WINDOW` of the transaction, the link is only made when exactly one
+    order qualifies.
+
+    The candidate orders of a vendor are loaded once and indexed in memory by
+    `(totalCost, day)`, every pending transaction is resolved against the
+    index and all links are written with one unordered `bulk_write`.
+    """
+
+    def __init__(self):
+        self.transactions = mongo["transactions"]
+
+    def match_vendor(self, vendor_phrase: Vendor.vendors_type) -> int:
+        """
+        Args:
+            vendor_phrase (str): The vendor whose orders are matched.
+
+        Returns:
+            int: The number of modified transactions.
+        """
+        orders_index = self._index_orders(vendor_phrase)
+
+        links = []
+        for txn in self._find_pending_transactions(vendor_phrase):
+            matched_ids = self._find_matches(orders_index, txn)
+
+            if len(matched_ids) == 1:
+                links.append((txn["_id"], matched_ids[0]))
+            elif len(matched_ids) > 1:
+                log.warn(
+                    f"Multiple matches found for transaction: {txn.get('_id')}, not updating. Matches: {matched_ids}"
+                )
+
+        return self._write_links(vendor_phrase, links)
+
+    def match_vendor_with_tolerance(
+        self,
+        vendor_phrase: Vendor.vendors_type,
+        amount_tolerance: float = AMOUNT_TOLERANCE,
+        window: timedelta = MATCH_WINDOW,
+    ) -> int:
+        """
+        Links transactions to orders whose amount is within `amount_tolerance`
+        and which were placed within `window` of the transaction, so rounding
+        differences and tips no longer leave transactions unmapped.
+
+        Candidates are found by binary search over the orders sorted by date,
+        so only the orders inside the window of a transaction are compared
+        with it however often a price repeats. Every candidate pair is scored
+        by how far apart the amounts and the dates are. Ambiguous candidates
+        are resolved instead of being skipped: each group of transactions and
+        orders connected by candidate pairs gets the one-to-one assignment
+        linking the most pairs at the lowest total score. Orders already
+        linked to a transaction are not reused.
+
+        Args:
+            vendor_phrase (str): The vendor whose orders are matched.
+            amount_tolerance (float, optional): Largest accepted difference
+                between the withdrawal and the order total.
+            window (timedelta, optional): Largest accepted distance between the
+                value date and the order date.
+
+        Returns:
+            int: The number of modified transactions.
+        """
+        field = Vendor.get_transaction_foreign_field(vendor_phrase)
+        linked_ids = set(self.transactions.distinct(field))
+
+        order_ids, order_costs, order_dates = [], [], []
+        for order in self._find_orders(vendor_phrase):
+            if order["_id"] in linked_ids:
+                continue
+            order_ids.append(order["_id"])
+            order_costs.append(order["totalCost"])
+            order_dates.append(order["orderDate"])
+
+        txn_ids, txn_amounts, txn_dates = [], [], []
+        for txn in self._find_pending_transactions(vendor_phrase):
+            if txn.get("ValueDate") is None or txn.get("WithdrawalAmt") is None:
+                continue
+            txn_ids.append(txn["_id"])
+            txn_amounts.append(txn["WithdrawalAmt"])
+            txn_dates.append(txn["ValueDate"])
+
+        if not order_ids or not txn_ids:
+            log.warn(f"No matches found for vendor: {vendor_phrase}")
+            return 0
+
+        dates = np.asarray(order_dates, dtype="datetime64[ms]")
+        by_date = np.argsort(dates, kind="stable")
+        dates = dates[by_date]
+        costs = np.asarray(order_costs, dtype=float)[by_date]
+        amounts = np.asarray(txn_amounts, dtype=float)
+        value_dates = np.asarray(txn_dates, dtype="datetime64[ms]")
+
+        # Every transaction's window is a contiguous run of the sorted dates
+        window_ms = np.timedelta64(int(window.total_seconds() * 1000), "ms")
+        lows = np.searchsorted(dates, value_dates - window_ms, side="left")
+        highs = np.searchsorted(dates, value_dates + window_ms, side="left")
+        counts = highs - lows
+
+        # Flatten the runs into (transaction, order) pairs
+        pair_txns = np.repeat(np.arange(len(amounts)), counts)
+        run_starts = np.repeat(np.cumsum(counts) - counts, counts)
+        pair_orders = np.repeat(lows, counts) + np.arange(len(pair_txns)) - run_starts
+
+        amount_diffs = np.abs(costs[pair_orders] - amounts[pair_txns])
+        in_tolerance = amount_diffs <= amount_tolerance
+        pair_txns, pair_orders = pair_txns[in_tolerance], pair_orders[in_tolerance]
+
+        # 0 is a perfect match, each term grows to 1 at the edge of its range
+        amount_scores = amount_diffs[in_tolerance]
+        if amount_tolerance:
+            amount_scores = amount_scores / amount_tolerance
+        time_diffs = dates[pair_orders] - value_dates[pair_txns]
+        time_scores = np.abs(time_diffs / window_ms)
+        scores = amount_scores + time_scores
+
+        links = [
+            (txn_ids[txn_idx], order_ids[by_date[order_idx]])
+            for txn_idx, order_idx in _assign_pairs(
+                pair_txns, pair_orders, scores, len(amounts), len(costs)
+            )
+        ]
+        return self._write_links(vendor_phrase, links)
+
+    def match_vendor_in_database(self, vendor_phrase: Vendor.vendors_type) -> int:
+        """
+        Same links as `match_vendor`, joined by a single aggregation so no
+        transaction or order body leaves the database. The orders are joined
+        with a `$lookup` pipeline, only the ids of the transactions with
+        candidates come back and the unique matches are written with one
+        `bulk_write`, whose result is the modified count.
+
+        Args:
+            vendor_phrase (str): The vendor whose orders are matched.
+
+        Returns:
+            int: The number of modified transactions.
+        """
+        links = []
+        for txn in self.transactions.aggregate(
+            self._get_matching_pipeline(vendor_phrase)
+        ):
+            matched_ids = txn["matches"]
+            if len(matched_ids) == 1:
+                links.append((txn["_id"], matched_ids[0]))
+            else:
+                log.warn(
+                    f"Multiple matches found for transaction: {txn['_id']}, not updating. Matches: {matched_ids}"
+                )
+
+        return self._write_links(vendor_phrase, links)
+
+    def _get_matching_pipeline(self, vendor_phrase: Vendor.vendors_type) -> list:
+        window_ms = int(MATCH_WINDOW.total_seconds() * 1000)
+
+        return [
+            {"$match": self.get_pending_query(vendor_phrase)},
+            {
+                "$lookup": {
+                    "from": Vendor.get_collection(vendor_phrase).name,
+                    "let": {"amount": "$WithdrawalAmt", "value_date": "$ValueDate"},
+                    "pipeline": [
+                        {
+                            "$match": {
+                                **Vendor.get_match_filters(vendor_phrase),
+                                "$expr": {
+                                    "$and": [
+                                        {"$eq": ["$totalCost", "$$amount"]},
+                                        {
+                                            "$gte": [
+                                                "$orderDate",
+                                                {
+                                                    "$subtract": [
+                                                        "$$value_date",
+                                                        window_ms,
+                                                    ]
+                                                },
+                                            ]
+                                        },
+                                        {
+                                            "$lt": [
+                                                "$orderDate",
+                                                {"$add": ["$$value_date", window_ms]},
+                                            ]
+                                        },
+                                    ]
+                                },
+                            }
+                        },
+                        {"$project": {"_id": 1}},
+                        # a second hit already makes the match ambiguous
+                        {"$limit": 2},
+                    ],
+                    "as": "matches",
+                }
+            },
+            {"$match": {"matches": {"$ne": []}}},
+            {"$project": {"matches": "$matches._id"}},
+        ]
+
+    def get_pending_query(self, vendor_phrase: Vendor.vendors_type) -> dict:
+        field = Vendor.get_transaction_foreign_field(vendor_phrase)
+        return {
+            **vendor_tags.get_transaction_filter(vendor_phrase),
+            field: {"$exists": False},
+        }
+
+    def get_query_shapes(
+        self, vendor_phrase: Vendor.vendors_type
+    ) -> list[tuple[str, str, dict, None, bool]]:
+        """
+        `(collection, name, filter, sort, full_load)` of the queries matching a
+        vendor, so their plans can be checked with `explain`. `full_load` marks
+        the queries reading most of a collection, which are served best by a
+        collection scan.
+        """
+        return [
+            (
+                self.transactions.name,
+                f"{vendor_phrase} pending transactions",
+                self.get_pending_query(vendor_phrase),
+                None,
+                False,
+            ),
+            (
+                Vendor.get_collection(vendor_phrase).name,
+                f"{vendor_phrase} orders",
+                Vendor.get_match_filters(vendor_phrase),
+                None,
+                True,
+            ),
+        ]
+
+    def _find_pending_transactions(self, vendor_phrase: Vendor.vendors_type):
+        return self.transactions.find(
+            self.get_pending_query(vendor_phrase),
+            {"ValueDate": 1, "WithdrawalAmt": 1},
+        )
+
+    def _find_orders(self, vendor_phrase: Vendor.vendors_type) -> Iterator[dict]:
+        orders = Vendor.get_collection(vendor_phrase).find(
+            Vendor.get_match_filters(vendor_phrase),
+            {"totalCost": 1, "orderDate": 1},
+        )
+        for order in orders:
+            if order.get("orderDate") is None or order.get("totalCost") is None:
+                continue
+            yield order
+
+    def _write_links(self, vendor_phrase: Vendor.vendors_type, links: list) -> int:
+        """
+        Sets the vendor foreign key of the transactions, `links` holds
+        `(transaction_id, order_id)` pairs.
+        """
+        if not links:
+            log.warn(f"No matches found for vendor: {vendor_phrase}")
+            return 0
+
+        field = Vendor.get_transaction_foreign_field(vendor_phrase)
+        updates = [
+            UpdateOne({"_id": txn_id}, {"$set": {field: order_id}})
+            for txn_id, order_id in links
+        ]
+        result = self.transactions.bulk_write(updates, ordered=False)
+        return result.modified_count
+
+    def _index_orders(
+        self, vendor_phrase: Vendor.vendors_type
+    ) -> Dict[OrderKey, List[Tuple[datetime, object]]]:
+        orders_index = defaultdict(list)
+        for order in self._find_orders(vendor_phrase):
+            order_date = order["orderDate"]
+            total_cost = order["totalCost"]
+            orders_index[(total_cost, order_date.date())].append(
+                (order_date, order["_id"])
+            )
+
+        log.debug(f"Indexed {len(orders_index)} order keys of {vendor_phrase}")
+        return orders_index
+
+    def _find_matches(
+        self, orders_index: Dict[OrderKey, List[Tuple[datetime, object]]], txn: dict
+    ) -> list:
+        value_date = txn.get("ValueDate")
+        amount = txn.get("WithdrawalAmt")
+        if value_date is None or amount is None:
+            return []
+
+        prior_date = value_date - MATCH_WINDOW
+        next_date = value_date + MATCH_WINDOW
+
+        matched_ids = []
+        day = prior_date.date()
+        while day <= next_date.date():
+            for order_date, order_id in orders_index.get((amount, day), ()):
+                if prior_date <= order_date < next_date:
+                    matched_ids.append(order_id)
+            day += timedelta(days=1)
+        return matched_ids
+
+
+def _assign_pairs(
+    pair_txns: np.ndarray,
+    pair_orders: np.ndarray,
+    scores: np.ndarray,
+    txn_count: int,
+    order_count: int,
+) -> Iterator[Tuple[int, int]]:
+    """
+    `(transaction, order)` indexes of the optimal one-to-one assignment of
+    the scored candidate pairs. The pairs split into groups sharing no
+    transaction or order, each group is solved on its own so the cost
+    matrices stay as small as the ambiguity.
+    """
+    if not len(scores):
+        return
+
+    # transactions are the nodes 0..txn_count, orders follow them
+    graph = coo_matrix(
+        (np.ones(len(scores)), (pair_txns, txn_count + pair_orders)),
+        shape=(txn_count + order_count, txn_count + order_count),
+    )
+    _, labels = connected_components(graph, directed=False)
+    pair_groups = labels[pair_txns]
+
+    by_group = np.argsort(pair_groups, kind="stable")
+    group_starts = np.flatnonzero(np.diff(pair_groups[by_group])) + 1
+    for in_group in np.split(by_group, group_starts):
+        if len(in_group) == 1:
+            yield int(pair_txns[in_group[0]]), int(pair_orders[in_group[0]])
+            continue
+
+        group_txns, txn_rows = np.unique(pair_txns[in_group], return_inverse=True)
+        group_orders, order_cols = np.unique(pair_orders[in_group], return_inverse=True)
+
+        # a missing pair costs more than any set of real pairs, so the most
+        # pairs are linked first and the lowest score decides between them
+        missing = 2.0 * min(len(group_txns), len(group_orders)) + 1
+        costs = np.full((len(group_txns), len(group_orders)), missing)
+        costs[txn_rows, order_cols] = scores[in_group]
+        for row, col in zip(*linear_sum_assignment(costs)):
+            if costs[row, col] < missing:
+                yield int(group_txns[row]), int(group_orders[col])
@@ -2,6 +2,10 @@ function toggleQueryParam(paramName, value) {
   console.log("toggleQueryParam", paramName, value);
   const url = new URL(window.location.href);
   const params = new URLSearchParams(url.search);
+  // a page cursor only makes sense for the filters it was made with
+  if (paramName !== "after") {
+    params.delete("after");
+  }
 
   if (params.has(paramName) && params.get(paramName) == value) {
     params.delete(paramName);
@@ -0,0 +1,103 @@
+import os
+from typing import Dict, Iterable, Iterator, Optional
+
+from jinja2 import FileSystemBytecodeCache
+from jinjax import Component, HTMLAttrs
+from jinjax.catalog import Catalog
+from markupsafe import Markup
+
+from src.utils import convert_camel_to_title, get_logger, pipe_human_readable_date
+
+log = get_logger(__name__)
+
+TEMPLATE_FOLDER = "src/templates"
+
+# Compiled templates are kept here between runs, an entry is only used while
+# the source of its template is unchanged
+TEMPLATE_CACHE_FOLDER = ".template_cache"
+
+custom_filters = {}
+custom_filters["titleCase"] = convert_camel_to_title
+custom_filters["date"] = pipe_human_readable_date
+custom_filters["currency"] = lambda value: f"₹{value:,.2f}"
+
+catalog = Catalog()
+catalog.add_folder(TEMPLATE_FOLDER)
+catalog.jinja_env.filters.update(custom_filters)
+
+# Components compiled for `render_each`, by template name
+_components: Dict[str, Component] = {}
+
+
+def get_component(component_name: str) -> Component:
+    """
+    The compiled component, compiled again once its file changed. It is
+    loaded through the catalog's loader, the environment is left alone.
+    """
+    template_name = component_name.replace(".", "/") + catalog.file_ext
+    component = _components.get(template_name)
+    if component is None or not component.tmpl.is_up_to_date:
+        loader = catalog.prefixes[""]
+        source, _, _ = loader.get_source(catalog.jinja_env, template_name)
+        component = Component(
+            name=component_name,
+            source=source,
+            tmpl=loader.load(catalog.jinja_env, template_name),
+        )
+        _components[template_name] = component
+    return component
+
+
+def render_each(
+    component_name: str,
+    items: Iterable,
+    item_arg: str = "item",
+    index_arg: Optional[str] = None,
+    **kwargs,
+) -> Iterator[Markup]:
+    """
+    Renders a component once per item, passing the item as `item_arg` and its
+    1-based position as `index_arg`. The component is looked up and its
+    arguments are checked once for the whole list instead of once per item,
+    the templates call it as `render_each` for long lists. The items are
+    rendered as they are pulled, a streamed template sends every one before
+    the next is read.
+    """
+    component = get_component(component_name)
+    kwargs[item_arg] = None
+    if index_arg:
+        kwargs[index_arg] = 0
+    props, extra = component.filter_args(kwargs)
+    props["attrs"] = HTMLAttrs(extra)
+    props["content"] = ""
+
+    render = component.tmpl.render
+    for index, item in enumerate(items, start=1):
+        props[item_arg] = item
+        if index_arg:
+            props[index_arg] = index
+        yield Markup(render(props).strip())
+
+
+def warm_catalog() -> list[str]:
+    """
+    Sets up the bytecode cache and compiles every component into it, so the
+    first request rendering a component loads its bytecode instead of
+    compiling it. Templates which did not change are not compiled again.
+
+    Returns:
+        list[str]: Names of the compiled templates.
+    """
+    os.makedirs(TEMPLATE_CACHE_FOLDER, exist_ok=True)
+    catalog.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_FOLDER)
+
+    names = []
+    for loader in catalog.prefixes.values():
+        for name in loader.list_templates():
+            if name.endswith(catalog.file_ext):
+                # loads through the bytecode cache without touching the
+                # environment's loader, which the catalog sets per render
+                loader.load(catalog.jinja_env, name)
+                names.append(name)
+    log.info(f"Compiled {len(names)} templates")
+    return names
@@ -5,7 +5,15 @@ import colorlog
 import pandas as pd
 import re
 import datetime
-from typing import Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+try:
+    # faster drop-in decoder for the large vendor exports
+    import orjson
+except ImportError:
+    orjson = None
 
 
 # Dump logs in a file
@@ -20,10 +28,35 @@ file_handler.setLevel(logging.DEBUG)
 formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 file_handler.setFormatter(formatter)
 
+# Json files read ahead of the parser by iter_json_files
+JSON_READ_WORKERS = 4
+
 
 def read_json_files_from_folder(folder_path: str) -> list[dict]:
+    return [read_json_file(file_path) for file_path in get_json_file_paths(folder_path)]
+
+
+def iter_json_files(
+    file_paths: list[str], workers: int = JSON_READ_WORKERS
+) -> Iterator[dict]:
+    """
+    Lazily decode json files, `workers` of them are read ahead in a thread
+    pool.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file_path in file_paths:
+            pending.append(executor.submit(read_json_file, file_path))
+            # only keep `workers` files in flight ahead of the consumer
+            if len(pending) > workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def get_json_file_paths(folder_path: str) -> list[str]:
     return [
-        read_json_file(file_path)
+        file_path
         for file_path in get_all_file_paths(folder_path)
         if file_path.endswith(".json") and "old" not in file_path
     ]
@@ -31,6 +64,9 @@ def read_json_files_from_folder(folder_path: str) -> list[dict]:
 
 def read_json_file(file_path):
     try:
+        if orjson is not None:
+            with open(file_path, "rb") as file:
+                return orjson.loads(file.read())
         with open(file_path, "r") as file:
             data = json.load(file)
         return data
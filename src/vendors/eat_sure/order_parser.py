@@ -1,5 +1,5 @@
 from src.vendors.parser import Parser
-from typing import List
+from typing import Iterable, Optional
 import pandas as pd
 
 from src.utils import get_logger
@@ -8,8 +8,14 @@ log = get_logger(__name__)
 
 
 class EatSureOrderParser(Parser):
-    def __init__(self, json_data_list: list[dict]):
-        super().__init__(json_data_list)
+    orders_path = ("data", "pastOrders")
+
+    def __init__(
+        self,
+        json_data_list: Iterable[dict] = (),
+        file_paths: Optional[list[str]] = None,
+    ):
+        super().__init__(json_data_list, file_paths)
 
     def extract_order_details(self, order_data: dict):
         details = {}
@@ -70,14 +76,6 @@ class EatSureOrderParser(Parser):
         details["items"] = items
         return details
 
-    def _parse_orders(self) -> List[dict]:
-        orders = []
-        for json_data in self.json_data_list:
-            past_orders = json_data["data"]["pastOrders"]
-            for order_data in past_orders:
-                orders.append(self.extract_order_details(order_data))
-        return orders
-
     def _read_data(self) -> pd.DataFrame:
         df = pd.DataFrame(self._parse_orders())
 
@@ -1,6 +1,8 @@
 import pandas as pd
+from src.json_stream import iter_json_items
 from src.utils import get_logger
-from typing import List
+from itertools import chain
+from typing import Iterable, Iterator, List, Optional
 from abc import abstractmethod, ABCMeta
 
 log = get_logger(__name__)
@@ -10,16 +12,87 @@ class Parser:
     __metaclass__ = ABCMeta
     invalid_init = False
 
-    def __init__(self, json_data_list: list[dict]):
-        self.json_data_list = json_data_list
-        if len(self.json_data_list) == 0:
+    # bump when the parsed orders change, cached frames of older versions are ignored
+    parser_version = 1
+
+    # keys leading from the root of a vendor export to its orders
+    orders_path: tuple[str, ...] = ()
+
+    # an export without `orders_path` has no orders instead of being an error
+    orders_path_optional = False
+
+    def __init__(
+        self,
+        json_data_list: Iterable[dict] = (),
+        file_paths: Optional[list[str]] = None,
+    ):
+        """
+        Args:
+            json_data_list (Iterable[dict]): Decoded json files, either a list or
+                an iterator which reads the files while the orders are parsed.
+            file_paths (list[str], optional): Incremental mode, the orders are
+                decoded one by one out of these files instead of decoding
+                whole exports, `json_data_list` is ignored. Only decoding
+                streams, the parsed orders are still collected in one frame.
+        """
+        self.file_paths = file_paths
+        if file_paths is not None:
+            self.json_data_list = []
+            if len(file_paths) == 0:
+                self.invalid_init = True
+            log.info(f"streaming orders from {len(file_paths)} json data files")
+            return
+
+        if isinstance(json_data_list, list):
+            self.json_data_list = json_data_list
+            if len(self.json_data_list) == 0:
+                self.invalid_init = True
+            log.info(f"total json data files: {len(json_data_list)}")
+            return
+
+        # Only peek at lazily read files, the rest is pulled while parsing
+        json_data_iter = iter(json_data_list)
+        # a file holding json `null` is still a file
+        no_files = object()
+        first_json_data = next(json_data_iter, no_files)
+        if first_json_data is no_files:
             self.invalid_init = True
-        log.info(f"total json data files: {len(json_data_list)}")
+            self.json_data_list = []
+        else:
+            self.json_data_list = chain([first_json_data], json_data_iter)
+        log.info("reading json data files lazily")
 
     @abstractmethod
-    def _parse_orders(self) -> List[dict]:
+    def extract_order_details(self, order_data: dict) -> dict:
         raise NotImplementedError
 
+    def _parse_orders(self) -> List[dict]:
+        return [
+            self.extract_order_details(order_data)
+            for order_data in self._iter_order_data()
+        ]
+
+    def _iter_order_data(self) -> Iterator[dict]:
+        if self.file_paths is not None:
+            for file_path in self.file_paths:
+                yield from iter_json_items(
+                    file_path, self.orders_path, self.orders_path_optional
+                )
+            return
+
+        for json_data in self.json_data_list:
+            orders = json_data
+            for key in self.orders_path:
+                if not isinstance(orders, dict) or key not in orders:
+                    if self.orders_path_optional:
+                        orders = ()
+                        break
+                    raise KeyError(
+                        f"{'.'.join(self.orders_path)} not found in a {type(self).__name__} export"
+                    )
+                orders = orders[key]
+            yield from orders.values() if isinstance(orders, dict) else orders
+
     @abstractmethod
     def _read_data(self) -> pd.DataFrame:
         raise NotImplementedError
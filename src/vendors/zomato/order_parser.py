@@ -1,58 +1,77 @@
+import numpy as np
 import pandas as pd
 import re
+from typing import Iterable, Optional
 from src.utils import get_logger
+from src.vendors.parser import Parser
 
 log = get_logger(__name__)
 
+DISH_PATTERN = re.compile(r"^(?P<quantity>\d+)\s*x\s*(?P<name>.*)")
 
-class OrderParser:
-    invalid_init = False
 
-    def __init__(self, json_data_list: list[dict]):
-        self.json_data_list = json_data_list
-        if len(self.json_data_list) == 0:
-            self.invalid_init = True
-        log.info(f"total json data files: {len(json_data_list)}")
+class OrderParser(Parser):
+    orders_path = ("entities", "ORDER")
+    parser_version = 2
 
-    def _extract_dishes(self, dish_string):
-        dishes = []
-        # Split the dish string into individual items
-        items = dish_string.split(", ")
-        # Extract quantity and dish name for each item
-        for item in items:
-            # Use regular expression to extract quantity and dish name
-            match = re.match(r"(\d+)\s*x\s*(.*)", item)
-            if match:
-                quantity = int(match.group(1))
-                name = match.group(2).strip()
-                dishes.append(dict(name=name, quantity=quantity))
+    def __init__(
+        self,
+        json_data_list: Iterable[dict] = (),
+        file_paths: Optional[list[str]] = None,
+    ):
+        super().__init__(json_data_list, file_paths)
 
-        return dishes
+    def _extract_dishes(self, dish_strings: pd.Series) -> pd.Series:
+        """
+        Splits every `dishString` ("2 x Paneer Roll, 1 x Coke") into its items,
+        one list of `{name, quantity}` dicts per order, empty when no item
+        matched.
+        """
+        # One row per item, the index still points at the order
+        items = dish_strings.fillna("").str.split(", ").explode()
+        dishes = items.str.extract(DISH_PATTERN).dropna()
 
-    def _parse_orders(self):
-        orders = []
-        for json_data in self.json_data_list:
-            for order_id, order_info in json_data["entities"]["ORDER"].items():
-                order = {
-                    "_id": order_info["orderId"],
-                    "totalCost": order_info["totalCost"],
-                    "orderDate": order_info["orderDate"],
-                    "status": order_info["status"],
-                    "deliveryAddress": order_info["deliveryDetails"]["deliveryAddress"],
-                    "restaurantName": order_info["resInfo"]["name"],
-                    "restaurantRating": order_info["resInfo"]["rating"][
-                        "aggregate_rating"
-                    ],
-                    "restaurantThumb": order_info["resInfo"]["thumb"],
-                    "paymentStatus": order_info.get("paymentStatus", ""),
-                    "dishString": order_info.get("dishString", ""),
-                }
-                orders.append(order)
-        return orders
+        records = [
+            dict(name=name, quantity=quantity)
+            for name, quantity in zip(
+                dishes["name"].str.strip().tolist(),
+                dishes["quantity"].astype(int).tolist(),
+            )
+        ]
+        # explode keeps the items of an order next to each other, cut the
+        # records wherever the order changes
+        order_index = dishes.index.to_numpy()
+        starts = np.flatnonzero(
+            np.r_[len(records) > 0, order_index[1:] != order_index[:-1]]
+        )
+        ends = np.r_[starts[1:], len(records)]
+        grouped = pd.Series(
+            [records[start:end] for start, end in zip(starts, ends)],
+            index=order_index[starts],
+            dtype=object,
+        )
+
+        orders_dishes = pd.Series(
+            [[] for _ in range(len(dish_strings))], index=dish_strings.index
+        )
+        orders_dishes.loc[grouped.index] = grouped
+        return orders_dishes
+
+    def extract_order_details(self, order_info: dict) -> dict:
+        return {
+            "_id": order_info["orderId"],
+            "totalCost": order_info["totalCost"],
+            "orderDate": order_info["orderDate"],
+            "status": order_info["status"],
+            "deliveryAddress": order_info["deliveryDetails"]["deliveryAddress"],
+            "restaurantName": order_info["resInfo"]["name"],
+            "restaurantRating": order_info["resInfo"]["rating"]["aggregate_rating"],
+            "restaurantThumb": order_info["resInfo"]["thumb"],
+            "paymentStatus": order_info.get("paymentStatus", ""),
+            "dishString": order_info.get("dishString", ""),
+        }
 
-    def read_data(self):
-        if self.invalid_init:
-            raise ValueError("No valid file paths were provided.")
+    def _read_data(self):
         orders_data = self._parse_orders()
         orders_df = pd.DataFrame(orders_data)
 
@@ -66,9 +85,10 @@ class OrderParser:
         orders_df["status"] = orders_df["status"].astype(int)
         orders_df["paymentStatus"] = orders_df["paymentStatus"].astype(int)
 
-        orders_df.drop_duplicates(inplace=True)
+        # The same order shows up on several pages of an export
+        orders_df.drop_duplicates(subset="_id", inplace=True)
 
-        orders_df["items"] = orders_df["dishString"].apply(self._extract_dishes)
+        orders_df["items"] = self._extract_dishes(orders_df["dishString"])
 
         orders_df.sort_values(by="orderDate", inplace=True)
         return orders_df
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from src.service.vendor_matching import VendorMatchingService
+
+
+class FakeTransactions:
+    def __init__(self):
+        self.updates = []
+
+    def distinct(self, field):
+        return []
+
+    def bulk_write(self, updates, ordered):
+        self.updates.extend(updates)
+        return type("Result", (), {"modified_count": len(updates)})()
+
+
+def get_matcher(transactions, orders):
+    matcher = VendorMatchingService.__new__(VendorMatchingService)
+    matcher.transactions = FakeTransactions()
+    matcher._find_pending_transactions = lambda vendor_phrase: transactions
+    matcher._find_orders = lambda vendor_phrase: orders
+    return matcher
+
+
+def get_links(matcher):
+    return {
+        update._filter["_id"]: update._doc["$set"]["zomato"]
+        for update in matcher.transactions.updates
+    }
+
+
+def test_tolerance_links_exact_matches():
+    matcher = get_matcher(
+        [{"_id": "t1", "ValueDate": datetime(2024, 1, 2), "WithdrawalAmt": 100.0}],
+        [{"_id": "o1", "orderDate": datetime(2024, 1, 2, 9), "totalCost": 100.0}],
+    )
+
+    assert matcher.match_vendor_with_tolerance("zomato") == 1
+    assert get_links(matcher) == {"t1": "o1"}
+
+
+def test_tolerance_assignment_is_optimal_not_greedy():
+    # t2-o1 is the best single pair, taking it leaves t1 with the worse o2,
+    # linking t1-o1 and t2-o2 costs less in total
+    matcher = get_matcher(
+        [
+            {"_id": "t1", "ValueDate": datetime(2024, 1, 2), "WithdrawalAmt": 100.0},
+            {
+                "_id": "t2",
+                "ValueDate": datetime(2024, 1, 2, 10),
+                "WithdrawalAmt": 100.0,
+            },
+        ],
+        [
+            {
+                "_id": "o1",
+                "orderDate": datetime(2024, 1, 2, 7, 12),
+                "totalCost": 100.0,
+            },
+            {"_id": "o2", "orderDate": datetime(2024, 1, 2, 12), "totalCost": 100.2},
+        ],
+    )
+
+    assert matcher.match_vendor_with_tolerance("zomato") == 2
+    assert get_links(matcher) == {"t1": "o1", "t2": "o2"}
+
+
+def test_tolerance_skips_pairs_outside_the_window_and_tolerance():
+    matcher = get_matcher(
+        [
+            {"_id": "t1", "ValueDate": datetime(2024, 1, 2), "WithdrawalAmt": 100.0},
+            {"_id": "t2", "ValueDate": datetime(2024, 3, 2), "WithdrawalAmt": 50.0},
+        ],
+        [
+            {"_id": "o1", "orderDate": datetime(2024, 1, 9), "totalCost": 100.0},
+            {"_id": "o2", "orderDate": datetime(2024, 3, 2), "totalCost": 52.0},
+        ],
+    )
+
+    assert matcher.match_vendor_with_tolerance("zomato") == 0
+    assert get_links(matcher) == {}
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from src.vendors.zepto.order_parser import ZeptoOrderParser
+from src.vendors.zomato.order_parser import OrderParser as ZomatoOrderParser
+
+ZEPTO_ORDER = {
+    "id": "z1",
+    "grandTotalAmount": 12050,
+    "placedTime": "2024-01-02T10:00:00",
+    "status": "DELIVERED",
+    "paymentStatus": "PAID",
+    "itemQuantityCount": 1,
+    "totalDeliveryTimeInSeconds": 600,
+    "productsNamesAndCounts": [{"name": "Milk", "count": 1}],
+}
+
+
+def write_exports(tmp_path, exports):
+    file_paths = []
+    for number, export in enumerate(exports):
+        file_path = tmp_path / f"export_{number}.json"
+        file_path.write_text(json.dumps(export))
+        file_paths.append(str(file_path))
+    return file_paths
+
+
+def test_zepto_export_without_orders_key_has_no_orders():
+    parser = ZeptoOrderParser([{"orders": [ZEPTO_ORDER]}, {"user": "no orders"}])
+
+    orders_df = parser.read_data()
+
+    assert orders_df["_id"].tolist() == ["z1"]
+    assert orders_df["totalCost"].tolist() == [120.5]
+
+
+def test_zepto_streamed_export_without_orders_key_has_no_orders(tmp_path):
+    file_paths = write_exports(tmp_path, [{"user": "no orders"}])
+
+    orders_df = ZeptoOrderParser(file_paths=file_paths).read_data()
+
+    assert orders_df.empty
+
+
+def test_export_without_required_orders_path_fails(tmp_path):
+    with pytest.raises(KeyError):
+        ZomatoOrderParser([{"entities": {}}]).read_data()
+
+    file_paths = write_exports(tmp_path, [{"entities": {}}])
+    with pytest.raises(KeyError):
+        ZomatoOrderParser(file_paths=file_paths).read_data()